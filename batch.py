@@ -0,0 +1,299 @@
+"""Пакетный рендеринг по манифесту без диалога
+
+Манифест - CSV с заголовком или JSONL, по записи на изображение:
+
+    image      путь к фото или URL (http/https)
+    text       заголовок
+    variants   (опционально) варианты через запятую: square, landscape_center, ...
+               или landscape - ландшафт с выравниванием из alignment
+    alignment  (опционально) top, center, bottom или auto (по умолчанию bottom)
+    format     (опционально) профиль кодирования: png, png_small, jpeg, webp, webp_lossless
+    id         (опционально) идентификатор записи и имя файлов результата
+
+Манифест читается потоково, записи обрабатываются на пуле процессов с
+ограниченной очередью. Итог по каждой записи (статус, файлы, время этапов,
+пиковая память) дописывается строкой JSON в файл результатов. При повторном
+запуске успешно обработанные записи пропускаются - можно продолжить после
+прерывания.
+
+    python batch.py campaign.csv
+    python batch.py campaign.jsonl --results results.jsonl --workers 4
+"""
+import os
+import sys
+import csv
+import json
+import time
+import glob
+import argparse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Set
+
+import main
+from main import ImageProcessorError, logger
+
+# Сколько записей держать в очереди на один процесс
+QUEUE_PER_WORKER = 2
+
+# Таймаут скачивания фото по URL, сек
+DOWNLOAD_TIMEOUT = 30
+
+# Логотип процесса (загружается один раз в инициализаторе)
+_logo = None
+
+def _parse_row(path: str, index: int, row) -> dict:
+    """Запись манифеста из строки CSV (словарь) или JSONL (текст)"""
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except json.JSONDecodeError as e:
+            raise ImageProcessorError(f"{path}:{index}: некорректный JSON: {e}")
+    if not isinstance(row, dict):
+        raise ImageProcessorError(f"{path}:{index}: ожидается объект JSON")
+    item = {str(key).strip().lower(): value for key, value in row.items() if key}
+    if not item.get('image') or not item.get('text'):
+        raise ImageProcessorError(f"{path}:{index}: нужны поля image и text")
+    return item
+
+def read_manifest(path: str) -> Iterator[dict]:
+    """Потоковое чтение манифеста: записи с номером строки (row) и идентификатором (id)
+    
+    Некорректная строка не прерывает чтение: вместо записи выдается
+    {'row', 'id', 'image', 'error'} - ее итог пишется в файл результатов как ошибка.
+    """
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = ((index, row) for index, row in enumerate(csv.DictReader(f), start=2))
+        else:
+            rows = ((index, line) for index, line in enumerate(f, start=1) if line.strip())
+        for index, row in rows:
+            try:
+                item = _parse_row(path, index, row)
+            except ImageProcessorError as e:
+                yield {'row': index, 'id': str(index), 'image': None, 'error': str(e)}
+                continue
+            item['row'] = index
+            if item.get('id'):
+                item['id'] = item['base_name'] = str(item['id'])
+            else:
+                stem = os.path.splitext(os.path.basename(item['image'].split('?')[0]))[0] or 'image'
+                item['id'], item['base_name'] = str(index), f"{index:06d}_{stem}"
+            yield item
+
+def read_done(path: str) -> Set[str]:
+    """Идентификаторы записей, уже успешно обработанных в прошлых запусках"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Последняя строка могла оборваться при прерывании
+                continue
+            if record.get('status') == 'ok':
+                done.add(record['id'])
+    return done
+
+def resolve_variants(item: dict) -> List[str]:
+    """Имена вариантов записи (landscape раскрывается по alignment)"""
+    alignment = (item.get('alignment') or 'bottom').strip()
+    if alignment not in main.IMAGE_ALIGNMENTS:
+        raise ImageProcessorError(f"Неизвестное выравнивание: {alignment}")
+    names = item.get('variants') or ['square', 'landscape']
+    if isinstance(names, str):
+        names = names.replace(';', ',').split(',')
+    variants = []
+    for name in (name.strip() for name in names):
+        if name == 'landscape':
+            name = f"landscape_{alignment}"
+        if name and name not in variants:
+            variants.append(name)
+    return variants
+
+def load_image_data(image: str) -> bytes:
+    """Байты фото по пути или URL"""
+    if image.startswith(('http://', 'https://')):
+        request = urllib.request.Request(image, headers={'User-Agent': 'my-bot-batch'})
+        with urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT) as response:
+            return response.read()
+    with open(image, 'rb') as f:
+        return f.read()
+
+def init_worker(logo_path: str) -> None:
+    """Инициализация процесса: логотип, шрифты и рамки грузятся один раз"""
+    global _logo
+    _logo = main.safe_open_image(logo_path)
+    if _logo is None:
+        raise ImageProcessorError('Не удалось загрузить логотип!')
+    try:
+        main.FONT_REGISTRY.preload()
+        main.preload_brand_frames(_logo)
+    except Exception as e:
+        raise ImageProcessorError(f"Не удалось подготовить шрифты и рамки: {e}")
+
+def _error_record(item: dict, error: str) -> dict:
+    return {'id': item['id'], 'row': item['row'], 'image': item['image'], 'status': 'error',
+            'error': error, 'outputs': {}, 'cached': [], 'seconds': 0.0}
+
+def process_item(item: dict, output_dir: str) -> dict:
+    """Рендеринг одной записи; ошибки возвращаются в записи результата"""
+    start_time = time.time()
+    timings = main.StageTimings() if main.STAGE_TIMING else None
+    record = {'id': item['id'], 'row': item['row'], 'image': item['image']}
+    try:
+        variants = resolve_variants(item)
+        download_start = time.perf_counter()
+        data = load_image_data(item['image'])
+        if timings is not None:
+            timings.add('download', time.perf_counter() - download_start)
+        results = main.render(data, item['text'], variants, logo_img=_logo, output_dir=output_dir,
+                              base_name=item['base_name'], profile=item.get('format') or None, timings=timings)
+        missing = [name for name in variants if name not in results]
+        record.update({
+            'status': 'error' if missing else 'ok',
+            'error': f"не удалось отрисовать: {', '.join(missing)}" if missing else None,
+            'outputs': {name: result['path'] for name, result in results.items()},
+            'cached': [name for name, result in results.items() if result['cached']],
+        })
+    except Exception as e:
+        record.update({'status': 'error', 'error': str(e), 'outputs': {}, 'cached': []})
+    record['seconds'] = time.time() - start_time
+    if timings is not None:
+        stages = timings.as_dict()
+        record['stages'] = stages['stages']
+        if 'peak_memory_mb' in stages:
+            record['peak_memory_mb'] = stages['peak_memory_mb']
+    return record
+
+def run_manifest(manifest: str, results_path: str, logo_path: str, output_dir: str,
+                 workers: int, resume: bool = True) -> dict:
+    """Обработка манифеста; возвращает сводку {'ok', 'failed', 'skipped', 'seconds'}"""
+    # Логотип проверяем до запуска: без него одинаково не работают оба режима
+    if main.safe_open_image(logo_path) is None:
+        raise ImageProcessorError('Не удалось загрузить логотип!')
+    done = read_done(results_path) if resume else set()
+    if done:
+        logger.info(f"Продолжение: пропускаем {len(done)} уже обработанных записей")
+    os.makedirs(output_dir, exist_ok=True)
+    summary = {'ok': 0, 'failed': 0, 'skipped': 0}
+    start_time = time.time()
+
+    with open(results_path, 'a' if resume else 'w', encoding='utf-8') as results_file:
+        def report(record: dict) -> None:
+            # Запись сразу сбрасывается на диск: после прерывания она не потеряется
+            results_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            results_file.flush()
+            summary['ok' if record['status'] == 'ok' else 'failed'] += 1
+            status = '✅' if record['status'] == 'ok' else f"❌ {record['error']}"
+            logger.info(f"[{summary['ok'] + summary['failed']}] {record['id']} {record['image']}: "
+                        f"{status} ({record['seconds']:.2f} сек)")
+
+        def pending_items() -> Iterator[dict]:
+            for item in read_manifest(manifest):
+                if item['id'] in done:
+                    summary['skipped'] += 1
+                    continue
+                if item.get('error'):
+                    # Некорректная строка манифеста: ошибка в результатах, остальные записи идут дальше
+                    report(_error_record(item, item['error']))
+                    continue
+                yield item
+
+        if workers == 1:
+            init_worker(logo_path)
+            for item in pending_items():
+                report(process_item(item, output_dir))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(logo_path,)) as executor:
+                # Ограниченная очередь: манифест читается по мере освобождения процессов
+                queue_size = workers * QUEUE_PER_WORKER
+                futures = {}  # future -> запись манифеста
+                broken = None
+
+                def collect(finished) -> None:
+                    # Ошибка процесса (упал, убит, не прошла инициализация) - запись об ошибке
+                    nonlocal broken
+                    for future in finished:
+                        item = futures.pop(future)
+                        try:
+                            report(future.result())
+                        except BrokenProcessPool as e:
+                            broken = e
+                            report(_error_record(item, f"пул процессов остановился: {e}"))
+                        except Exception as e:
+                            report(_error_record(item, str(e)))
+
+                try:
+                    for item in pending_items():
+                        try:
+                            futures[executor.submit(process_item, item, output_dir)] = item
+                        except BrokenProcessPool as e:
+                            broken = e
+                            report(_error_record(item, f"пул процессов остановился: {e}"))
+                        if broken is not None:
+                            break
+                        if len(futures) >= queue_size:
+                            collect(wait(futures, return_when=FIRST_COMPLETED)[0])
+                            if broken is not None:
+                                break
+                    collect(list(futures))
+                except KeyboardInterrupt:
+                    for future in futures:
+                        future.cancel()
+                    raise
+                if broken is not None:
+                    raise ImageProcessorError(f"Пул процессов остановился, повторный запуск продолжит "
+                                              f"с необработанных записей: {broken}")
+
+    summary['seconds'] = time.time() - start_time
+    return summary
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Пакетный рендеринг по манифесту (CSV или JSONL)')
+    parser.add_argument('manifest', help='CSV с заголовком или JSONL: image, text, variants, alignment, format, id')
+    parser.add_argument('--results', default=None,
+                        help='JSONL-файл результатов (по умолчанию <манифест>.results.jsonl, например campaign.csv.results.jsonl)')
+    parser.add_argument('--output-dir', default=None,
+                        help=f"Папка для готовых изображений (по умолчанию {main.OUTPUT_DIR}/<имя манифеста>)")
+    parser.add_argument('--logo', default=None, help=f"Логотип (по умолчанию первый файл из {main.LOGO_DIR}/)")
+    parser.add_argument('--workers', type=int, default=main.BATCH_WORKERS or os.cpu_count() or 1,
+                        help='Число процессов')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='Начать заново: перезаписать файл результатов')
+    return parser.parse_args(argv)
+
+def main_batch(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    results_path = args.results or args.manifest + '.results.jsonl'
+    # Своя папка на манифест: кампании не перезаписывают файлы друг друга, а
+    # повторный запуск того же манифеста продолжает в той же папке
+    output_dir = args.output_dir or os.path.join(
+        main.OUTPUT_DIR, os.path.splitext(os.path.basename(args.manifest))[0])
+    try:
+        logo_path = args.logo or next(iter(sorted(glob.glob(os.path.join(main.LOGO_DIR, '*')))), None)
+        if logo_path is None:
+            raise ImageProcessorError('Логотип не найден в папке logo!')
+        summary = run_manifest(args.manifest, results_path, logo_path, output_dir,
+                               max(args.workers, 1), resume=not args.no_resume)
+    except ImageProcessorError as e:
+        logger.error(f"Ошибка пакетной обработки: {e}")
+        print(f"❌ Ошибка: {e}")
+        return 2
+    except KeyboardInterrupt:
+        print(f"\n⏹️  Прервано. Повторный запуск продолжит с места остановки ({results_path})")
+        return 130
+
+    processed = summary['ok'] + summary['failed']
+    print(f"\n✅ Готово: успешно {summary['ok']}, ошибок {summary['failed']}, пропущено {summary['skipped']}")
+    if processed and summary['seconds'] > 0:
+        print(f"🚀 Скорость: {processed / summary['seconds']:.2f} записей/сек")
+    print(f"📄 Результаты: {results_path}")
+    return 1 if summary['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main_batch())
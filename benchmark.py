@@ -0,0 +1,363 @@
+"""Бенчмарк конвейера рендеринга main.py
+
+Прогоняет синтетические (и, при наличии, реальные) изображения нескольких
+разрешений через все конфигурации и через каждый этап отдельно, замеряет
+время (реальное и процессорное) и пиковую память, сравнивает с сохраненной
+базой и завершается с кодом 1, если какой-то этап заметно замедлился
+(код 2, если базы нет - ее нужно сначала записать с --update). Этапы с
+подозрением на регрессию перемеряются, чтобы шум машины не давал ложных срабатываний.
+Работает полностью офлайн.
+
+    python benchmark.py --update      # записать базу
+    python benchmark.py               # сравнить с базой
+"""
+import os
+import io
+import sys
+import json
+import time
+import glob
+import ctypes
+import argparse
+import logging
+import platform
+import statistics
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+import main
+
+# Файл базы по умолчанию (рядом со скриптом)
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# Допустимое замедление этапа относительно базы (0.25 = +25%)
+DEFAULT_THRESHOLD = 0.25
+
+# Изменения меньше этого порога считаются шумом (сек и МБ)
+MIN_TIME_DELTA = 0.005
+MIN_MEMORY_DELTA = 8.0
+
+# Повторов на этап по умолчанию (плюс один разогревочный прогон)
+DEFAULT_REPEAT = 7
+
+# Регрессии времени ищутся по лучшему из повторов: помехи от других процессов
+# только замедляют прогон, поэтому минимум устойчивее медианы между запусками.
+# Замедление засчитывается, только если оно больше NOISE_FACTOR разбросов
+# (медианных абсолютных отклонений) базы и прогона вместе
+NOISE_FACTOR = 3.0
+
+# Сколько раз перемерить этап с подозрением на регрессию: регрессией считается,
+# только если этап медленнее базы во всех перемерах
+CONFIRM_RUNS = 2
+
+# Параметр mallopt в glibc
+M_MMAP_THRESHOLD = -3
+
+# Синтетические изображения: имя -> (ширина, высота)
+SYNTHETIC_SIZES = {
+    'small': (1280, 853),
+    'medium': (3000, 2000),
+    'large': (6000, 4000),
+}
+
+# Конфигурации main.py
+BENCH_CONFIGS = {
+    'square': main.CONFIG,
+    'landscape_center': main.CONFIG_LANDSCAPE_CENTER,
+    'landscape_top': main.CONFIG_LANDSCAPE_TOP,
+    'landscape_bottom': main.CONFIG_LANDSCAPE_BOTTOM,
+}
+
+# Заголовок для этапов с текстом (длинный, чтобы был перенос на несколько строк)
+BENCH_TEXT = 'Инвестиционный портал: новые возможности для бизнеса и поддержка проектов в регионе'
+
+STAGES = ['decode', 'resize', 'gradient', 'grid', 'text_layout', 'triangle', 'logo',
+          'frame', 'composite', 'encode', 'total']
+
+def make_synthetic_image(width: int, height: int, seed: int = 0) -> bytes:
+    """Детерминированное «фото»: плавные градиенты с шумом, закодированные в JPEG"""
+    rng = np.random.default_rng(seed)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    channels = [
+        120 + 100 * np.sin(6 * x + 3 * y),
+        110 + 90 * np.cos(4 * y - 2 * x),
+        100 + 80 * np.sin(5 * (x + y)),
+    ]
+    arr = np.stack(channels, axis=-1)
+    arr += rng.normal(0, 12, arr.shape).astype(np.float32)
+    img = Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8), 'RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+def collect_cases(sizes: List[str], image_paths: List[str]) -> Dict[str, bytes]:
+    """Исходные данные для бенчмарка: {имя случая: байты файла}"""
+    cases = {}
+    for name in sizes:
+        width, height = SYNTHETIC_SIZES[name]
+        cases[f'synthetic_{name}'] = make_synthetic_image(width, height)
+    for path in image_paths:
+        with open(path, 'rb') as f:
+            cases[f'real_{os.path.splitext(os.path.basename(path))[0]}'] = f.read()
+    return cases
+
+class PeakMemory:
+    """Замер пиковой памяти процесса
+
+    На Linux сбрасывает VmHWM через /proc/self/clear_refs и считает прирост
+    относительно текущего RSS. В остальных системах использует tracemalloc
+    (учитывает только аллокации Python и numpy, без буферов Pillow).
+    """
+
+    def __init__(self):
+        self.use_proc = self._proc_available()
+        self.baseline_kb = 0
+
+    @staticmethod
+    def _status_kb(field: str) -> int:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+        raise OSError(field)
+
+    def _proc_available(self) -> bool:
+        try:
+            # glibc по умолчанию повышает порог mmap после освобождения крупных
+            # буферов и держит их в куче - тогда прирост RSS не виден. Фиксируем
+            # порог, чтобы буферы изображений возвращались системе сразу.
+            ctypes.CDLL(None).mallopt(M_MMAP_THRESHOLD, 128 * 1024)
+        except (OSError, AttributeError):
+            pass
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            self._status_kb('VmHWM')
+            return True
+        except OSError:
+            return False
+
+    @property
+    def source(self) -> str:
+        return 'VmHWM' if self.use_proc else 'tracemalloc'
+
+    def start(self) -> None:
+        if self.use_proc:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            self.baseline_kb = self._status_kb('VmRSS')
+        else:
+            tracemalloc.start()
+
+    def stop(self) -> float:
+        """Прирост пиковой памяти в МБ с момента start()"""
+        if self.use_proc:
+            return max(self._status_kb('VmHWM') - self.baseline_kb, 0) / 1024
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak / (1024 * 1024)
+
+def measure(func: Callable[[], object], repeat: int, memory: PeakMemory) -> dict:
+    """Медиана реального и процессорного времени, ее разброс и максимум пиковой памяти"""
+    # Разогрев: первый вызов платит за ленивую инициализацию и выделение памяти
+    func()
+    walls, cpus, peaks = [], [], []
+    for _ in range(repeat):
+        memory.start()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        result = func()
+        walls.append(time.perf_counter() - wall_start)
+        cpus.append(time.process_time() - cpu_start)
+        peaks.append(memory.stop())
+        del result
+    wall = statistics.median(walls)
+    return {
+        'wall': wall,
+        'wall_min': min(walls),
+        'wall_noise': statistics.median(abs(value - wall) for value in walls),
+        'cpu': statistics.median(cpus),
+        'peak_mb': max(peaks),
+    }
+
+def stage_functions(data: bytes, config_name: str, logo_img: Image.Image) -> Dict[str, Callable[[], object]]:
+    """Этапы конвейера для одной пары (изображение, конфигурация)
+
+    Каждый этап меряется «холодным»: его собственные кэши сбрасываются
+    перед вызовом, а входные данные готовятся заранее.
+    """
+    config = BENCH_CONFIGS[config_name]
+    plan = main.get_render_plan(config)
+
+    # Входные данные этапов готовим вне замера
+    source = main.load_source_image(data, [config])
+    source.prepare([config])
+    font = plan.font
+    main.get_brand_frame(config, logo_img)
+    rendered = main.render_variant(source, logo_img, BENCH_TEXT, config)
+
+    def decode():
+        # Полное декодирование пикселей, а не только разбор заголовка
+        decoded = main.load_source_image(data, [config])
+        decoded.image.load()
+        return decoded
+
+    def resize():
+        return main.SourceImage(source.image).crop(config)
+
+    def text_layout():
+        main._text_measurers.clear()
+        return main.wrap_text(BENCH_TEXT, font, plan.max_text_width, plan.max_lines)
+
+    def total():
+        return main.render(data, BENCH_TEXT, [config_name], logo_img=logo_img)
+
+    return {
+        'decode': decode,
+        'resize': resize,
+        'gradient': lambda: main._gradient_array.__wrapped__(
+            plan.width, plan.grad_height, plan.gradient_start, plan.gradient_end, False),
+        'grid': lambda: main.render_grid_layer(config),
+        'text_layout': text_layout,
+        'triangle': lambda: main.create_triangle_layer(config),
+        'logo': lambda: main.LogoAssets().resized(logo_img, config.get('logo_size')),
+        'frame': lambda: main.BrandFrame(config, logo_img),
+        'composite': lambda: main.render_variant(source, logo_img, BENCH_TEXT, config),
+        'encode': lambda: main.encode_image(rendered),
+        'total': total,
+    }
+
+def run_benchmarks(cases: Dict[str, bytes], configs: List[str], stages: List[str],
+                   repeat: int, logo_img: Image.Image) -> dict:
+    """Прогон всех случаев; ключ результата - «случай/конфигурация/этап»"""
+    memory = PeakMemory()
+    results = {}
+    for case_name, data in cases.items():
+        for config_name in configs:
+            functions = stage_functions(data, config_name, logo_img)
+            for stage in stages:
+                key = f'{case_name}/{config_name}/{stage}'
+                results[key] = measure(functions[stage], repeat, memory)
+                print(f"{key:<50} {results[key]['wall'] * 1000:9.1f} мс  "
+                      f"CPU {results[key]['cpu'] * 1000:9.1f} мс  {results[key]['peak_mb']:7.1f} МБ")
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'pillow': Image.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'memory_source': memory.source,
+            'repeat': repeat,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'results': results,
+    }
+
+def regressions_for(result: dict, base: dict, key: str, threshold: float) -> List[str]:
+    """Регрессии одного этапа по времени и памяти относительно базы"""
+    regressions = []
+    field = 'wall_min' if 'wall_min' in base else 'wall'
+    wall_delta = result[field] - base[field]
+    noise = NOISE_FACTOR * (result.get('wall_noise', 0.0) + base.get('wall_noise', 0.0))
+    if wall_delta > max(MIN_TIME_DELTA, noise) and result[field] > base[field] * (1 + threshold):
+        regressions.append(f"{key}: время {base[field] * 1000:.1f} -> {result[field] * 1000:.1f} мс "
+                           f"(+{wall_delta / base[field] * 100:.0f}%)")
+    memory_delta = result['peak_mb'] - base['peak_mb']
+    if memory_delta > MIN_MEMORY_DELTA and result['peak_mb'] > base['peak_mb'] * (1 + threshold):
+        regressions.append(f"{key}: память {base['peak_mb']:.1f} -> {result['peak_mb']:.1f} МБ")
+    return regressions
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """Список регрессий по времени и памяти относительно базы"""
+    regressions = []
+    for key, result in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is not None:
+            regressions.extend(regressions_for(result, base, key, threshold))
+    return regressions
+
+def confirm_regressions(current: dict, baseline: dict, threshold: float, cases: Dict[str, bytes],
+                        repeat: int, logo_img: Image.Image) -> None:
+    """Перемер этапов с подозрением на регрессию (до CONFIRM_RUNS раз)
+
+    В результат идет лучший из замеров: случайное замедление машины во время
+    одного прогона не валит проверку, а настоящая регрессия повторяется.
+    """
+    memory = PeakMemory()
+    for key, result in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        case_name, config_name, stage = key.split('/')
+        for _ in range(CONFIRM_RUNS):
+            if not regressions_for(result, base, key, threshold):
+                break
+            print(f"Перемер {key}")
+            retry = measure(stage_functions(cases[case_name], config_name, logo_img)[stage], repeat, memory)
+            if retry.get('wall_min', retry['wall']) < result.get('wall_min', result['wall']):
+                result.update({name: value for name, value in retry.items() if name != 'peak_mb'})
+            result['peak_mb'] = min(result['peak_mb'], retry['peak_mb'])
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Бенчмарк конвейера рендеринга')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='JSON-файл базы')
+    parser.add_argument('--update', action='store_true', help='Записать результаты как новую базу')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Допустимое замедление этапа (0.25 = +25%%)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='Повторов на этап (в отчете медиана, для регрессий - минимум)')
+    parser.add_argument('--sizes', nargs='*', default=list(SYNTHETIC_SIZES), choices=list(SYNTHETIC_SIZES),
+                        help='Синтетические разрешения')
+    parser.add_argument('--images', nargs='*', default=None,
+                        help=f'Реальные изображения (по умолчанию - файлы из папки {main.IMG_DIR})')
+    parser.add_argument('--configs', nargs='*', default=list(BENCH_CONFIGS), choices=list(BENCH_CONFIGS))
+    parser.add_argument('--stages', nargs='*', default=STAGES, choices=STAGES)
+    return parser.parse_args(argv)
+
+def main_benchmark(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    # Логи рендеринга не нужны в выводе бенчмарка
+    main.logger.setLevel(logging.WARNING)
+
+    # Кэши готовых результатов и фонов превратили бы полный рендер в чтение из кэша
+    main.RESULT_CACHE = main.ResultCache(max_bytes=0)
+    main.BACKGROUND_CACHE = main.BackgroundCache(max_entries=0)
+
+    logo_img = main.LOGO_ASSETS.logo()
+    if logo_img is None:
+        print(f'❌ Логотип не найден в папке {main.LOGO_DIR}')
+        return 2
+
+    # Без базы сравнивать не с чем: это ошибка, а не успешная проверка
+    if not args.update and not os.path.exists(args.baseline):
+        print(f'❌ База {args.baseline} не найдена, запишите ее: python benchmark.py --update')
+        return 2
+
+    image_paths = args.images if args.images is not None else sorted(glob.glob(os.path.join(main.IMG_DIR, '*')))
+    cases = collect_cases(args.sizes, image_paths)
+    current = run_benchmarks(cases, args.configs, args.stages, args.repeat, logo_img)
+
+    if args.update:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f'\n📁 База сохранена: {args.baseline}')
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    confirm_regressions(current, baseline, args.threshold, cases, args.repeat, logo_img)
+    regressions = compare(current, baseline, args.threshold)
+    if regressions:
+        print(f'\n❌ Регрессии (порог +{args.threshold * 100:.0f}%):')
+        for line in regressions:
+            print(f'  {line}')
+        return 1
+    print(f'\n✅ Регрессий нет (порог +{args.threshold * 100:.0f}%)')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main_benchmark())
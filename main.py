@@ -1,7 +1,18 @@
 import os
 import logging
 import glob
-from typing import Optional, Tuple, List
+import hashlib
+import io
+import shutil
+import uuid
+import threading
+import weakref
+import bisect
+import functools
+import contextlib
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, List, Union
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 import numpy as np
 try:
@@ -9,6 +20,11 @@ try:
 except ImportError:
     Resampling = None
 import time
+try:
+    import fcntl
+except ImportError:  # Windows: без межпроцессной блокировки кэша
+    fcntl = None
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 # Настройка логирования
 logging.basicConfig(
@@ -96,14 +112,132 @@ CONFIG_LANDSCAPE_BOTTOM = {
     'logo_size': (180, 180)  # Размер логотипа для ландшафта
 }
 
+# Конфигурация для ландшафта - автоматический выбор кадра по карте значимости
+CONFIG_LANDSCAPE_AUTO = {
+    'target_size': (2310, 1200),  # Ширина x Высота
+    'gradient_height_ratio': 0.4,
+    'triangle_size': 600,  # Размер треугольника (как в квадратном)
+    'grid_square_size': 200,  # Уменьшаем сетку для ландшафта
+    'grid_line_thickness': 3,  # Тоньше линии для ландшафта
+    'grid_opacity_ratio': 0.3,
+    'grid_vertical_offset': 50,  # Меньше смещение для ландшафта
+    'margins': {'text': 71, 'logo': 71},  # Новые отступы
+    'font_size': 150,  # Больший шрифт
+    'line_spacing_ratio': 0.2,
+    'gradient_colors': CONFIG['gradient_colors'],  # Те же цвета
+    'image_alignment': 'auto',  # Сдвиг подбирается так, чтобы важное не попало под градиент
+    'max_lines': 3,  # Максимальное количество строк для ландшафта
+    'logo_size': (180, 180)  # Размер логотипа для ландшафта
+}
+
 # Для обратной совместимости
 CONFIG_LANDSCAPE = CONFIG_LANDSCAPE_BOTTOM
 
+# Именованные варианты рендеринга (суффиксы файлов результата)
+VARIANTS = {
+    'square': CONFIG,
+    'landscape_center': CONFIG_LANDSCAPE_CENTER,
+    'landscape_top': CONFIG_LANDSCAPE_TOP,
+    'landscape_bottom': CONFIG_LANDSCAPE_BOTTOM,
+    'landscape_auto': CONFIG_LANDSCAPE_AUTO,
+}
+DEFAULT_VARIANTS = ['square', 'landscape_bottom']
+
+# Превью для выбора ориентации: все ландшафты на фото пользователя в уменьшенном виде
+PREVIEW_VARIANTS = ['landscape_auto', 'landscape_center', 'landscape_top', 'landscape_bottom']
+PREVIEW_SCALE = 0.25
+PREVIEW_PROFILE = 'preview'
+
+# Профили кодирования результата
+ENCODER_PROFILES = {
+    # PNG без медленного перебора optimize: в несколько раз быстрее, файл чуть больше
+    'png': {'format': 'PNG', 'extension': '.png', 'params': {'compress_level': 3}},
+    # Прежний режим: самый маленький PNG, но кодирование занимает секунды
+    'png_small': {'format': 'PNG', 'extension': '.png', 'params': {'optimize': True}},
+    # JPEG без субдискретизации цвета, чтобы не размывать края текста
+    'jpeg': {'format': 'JPEG', 'extension': '.jpg', 'params': {'quality': 95, 'subsampling': 0, 'optimize': True}},
+    'webp': {'format': 'WEBP', 'extension': '.webp', 'params': {'quality': 90, 'method': 4}},
+    'webp_lossless': {'format': 'WEBP', 'extension': '.webp', 'params': {'lossless': True, 'quality': 0, 'method': 0}},
+    # Превью для выбора в боте: быстро и мало, качество не критично
+    'preview': {'format': 'JPEG', 'extension': '.jpg', 'params': {'quality': 80}},
+}
+# Профиль по умолчанию для всего развертывания
+OUTPUT_PROFILE = 'png'
+
 # Папки
 IMG_DIR = 'img'
 LOGO_DIR = 'logo'
 OUTPUT_DIR = 'output'
 FONTS_DIR = 'fonts'
+CACHE_DIR = 'cache'
+# Папки задач: у каждой задачи рендеринга своя, удаляется после задачи
+JOBS_DIR = os.path.join(OUTPUT_DIR, 'jobs')
+
+# Через сколько секунд брошенная папка задачи считается мусором
+JOB_TTL = 3600
+
+# Шрифт заголовков и сколько его размеров держать в памяти
+DEFAULT_FONT = 'ACTAY-BOLD.OTF'
+FONT_CACHE_SIZE = 16
+
+# Количество различных градиентов, хранимых в памяти процесса
+GRADIENT_CACHE_SIZE = 32
+
+# Количество рамок бренда (по одной на размер/набор параметров)
+BRAND_FRAME_CACHE_SIZE = 8
+
+# Кэш готовых результатов на диске: бюджет по размеру (0 - кэш выключен)
+RESULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Версия формата ключей кэша результатов (менять при изменении отрисовки)
+RESULT_CACHE_VERSION = 1
+
+# Сколько хешей исходных файлов запоминать (по пути, mtime и размеру)
+RESULT_CACHE_DIGESTS_SIZE = 1024
+
+# При превышении бюджета кэш результатов вычищается до этой доли бюджета,
+# чтобы полный просмотр каталога не повторялся на каждой записи
+RESULT_CACHE_EVICT_RATIO = 0.9
+
+# Кадры с рамкой без текста для быстрой смены заголовка: количество и время жизни, сек
+BACKGROUND_CACHE_SIZE = 8
+BACKGROUND_CACHE_TTL = 600
+
+# Количество скомпилированных планов рендеринга (по одному на конфигурацию)
+RENDER_PLAN_CACHE_SIZE = 32
+
+# Допустимые выравнивания фото в ландшафте
+IMAGE_ALIGNMENTS = ('top', 'center', 'bottom', 'auto')
+
+# Автовыравнивание: размер карты значимости (по длинной стороне) и штраф
+# за значимое содержимое под полосой градиента
+SALIENCY_SIZE = 192
+SALIENCY_BAND_PENALTY = 1.5
+
+# Запас при предварительном уменьшении: после draft/reduce изображение остается
+# не меньше чем в REDUCING_GAP раз больше нужного, финал делает LANCZOS
+REDUCING_GAP = 2.0
+
+# Количество процессов пакетной обработки (None - по числу ядер)
+BATCH_WORKERS = None
+
+# Потоки кодирования и сохранения вариантов одного фото
+ENCODE_WORKERS = 2
+
+# Замеры времени этапов рендеринга (False - без инструментирования)
+STAGE_TIMING = True
+
+# Высота полосы строк при наложении рамки: ограничивает временные буферы uint16
+COMPOSITE_CHUNK_ROWS = 256
+
+# Границы корзин гистограмм этапов, сек
+STAGE_HISTOGRAM_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+# Сколько измерений слов и строк хранить на один шрифт
+TEXT_MEASURE_CACHE_SIZE = 4096
+
+# Количество растеризованных заголовков (маска на заголовок и размер шрифта)
+TEXT_LAYER_CACHE_SIZE = 32
 
 class ImageProcessorError(Exception):
     """Пользовательское исключение для ошибок обработки изображений"""
@@ -125,51 +259,446 @@ def safe_open_image(path: str) -> Optional[Image.Image]:
         logger.error(f"Ошибка открытия изображения {path}: {e}")
         return None
 
-def get_font(size: int, font_name: str = "ACTAY-BOLD.OTF") -> ImageFont.FreeTypeFont:
-    """Загрузка шрифта с улучшенной обработкой ошибок"""
-    font_path = os.path.join(FONTS_DIR, font_name)
-    
-    if not os.path.exists(font_path):
-        logger.warning(f"Шрифт {font_name} не найден в папке {FONTS_DIR}")
-        return ImageFont.load_default()
+def _cover_scale(size: Tuple[int, int], configs: List[dict]) -> float:
+    """Наибольший масштаб, нужный для покрытия целевых размеров всех конфигураций"""
+    width, height = size
+    return max(
+        max(target_width / width, target_height / height)
+        for target_width, target_height in (get_render_plan(config).size for config in configs)
+    )
+
+def load_source_image(source: Union[str, bytes], configs: Optional[List[dict]] = None) -> Optional['SourceImage']:
+    """Загрузка исходного фото с предварительным уменьшением под нужные размеры
     
+    JPEG декодируется сразу в уменьшенном масштабе (draft), затем целочисленный
+    reduce() приближает размер к целевому с запасом REDUCING_GAP, а финальный
+    LANCZOS делается уже при кадрировании. Фото без прозрачности остается в RGB.
+    Пиксели декодируются здесь же, файл закрывается до возврата.
+    """
+    name = source if isinstance(source, str) else '<bytes>'
     try:
-        return ImageFont.truetype(font_path, size)
-    except OSError as e:
-        logger.error(f"Ошибка загрузки шрифта {font_name}: {e}")
-        return ImageFont.load_default()
+        image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+        configs = configs or [CONFIG, CONFIG_LANDSCAPE_BOTTOM]
+        
+        # RGBA нужен только фото с прозрачностью; остальные держим в RGB
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        mode = 'RGBA' if has_alpha else 'RGB'
+        
+        scale = _cover_scale(image.size, configs) * REDUCING_GAP
+        if scale < 1:
+            # JPEG: декодирование в масштабе 1/2, 1/4 или 1/8
+            image.draft(image.mode, (max(int(image.width * scale), 1), max(int(image.height * scale), 1)))
+            # Остаток - целочисленным усреднением блоков. reduce() не работает
+            # с палитрой, 1-битными и 16-битными режимами, поэтому сначала convert
+            factor = int(1 / (_cover_scale(image.size, configs) * REDUCING_GAP))
+            if factor >= 2:
+                if image.mode != mode:
+                    image = image.convert(mode)
+                image = image.reduce(factor)
+        
+        if image.mode != mode:
+            image = image.convert(mode)
+        # Image.open ленивый: без load() декодирование ушло бы в первое
+        # масштабирование, а файл оставался бы открытым
+        image.load()
+        return SourceImage(image)
     except Exception as e:
-        logger.error(f"Неожиданная ошибка при загрузке шрифта: {e}")
-        return ImageFont.load_default()
+        logger.error(f"Ошибка открытия изображения {name}: {e}")
+        return None
 
-def create_gradient_optimized(width: int, height: int, start_color: Tuple[int, int, int], 
-                            end_color: Tuple[int, int, int], reverse: bool = False) -> Image.Image:
-    """Оптимизированное создание градиента с использованием numpy"""
-    try:
-        # Создаем массив градиента
-        if reverse:
-            # Градиент снизу вверх (плотный вверху, затухает к низу)
-            gradient = np.linspace(0, 1, height)[::-1]
-        else:
-            # Обычный градиент сверху вниз
-            gradient = np.linspace(0, 1, height)
+class FontRegistry:
+    """Общий для процесса реестр шрифтов
+    
+    Держит загруженные FreeTypeFont (не больше max_fonts, вытесняет давно не
+    использованные) и считает попадания, промахи и время загрузки каждого размера.
+    """
+    
+    def __init__(self, max_fonts: int = 16):
+        self.max_fonts = max_fonts
+        self._fonts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_times = {}
+    
+    def _load(self, size: int, font_name: str) -> ImageFont.FreeTypeFont:
+        """Загрузка шрифта с улучшенной обработкой ошибок"""
+        font_path = os.path.join(FONTS_DIR, font_name)
         
-        # Создаем RGB каналы с правильным broadcasting
-        r = np.full((height, width), 0)
-        g = np.full((height, width), 0)
-        b = np.full((height, width), 0)
-        alpha = np.full((height, width), 0)
+        if not os.path.exists(font_path):
+            logger.warning(f"Шрифт {font_name} не найден в папке {FONTS_DIR}")
+            return ImageFont.load_default()
         
-        for i in range(height):
-            ratio = gradient[i]
-            r[i, :] = int(start_color[0] + (end_color[0] - start_color[0]) * ratio)
-            g[i, :] = int(start_color[1] + (end_color[1] - start_color[1]) * ratio)
-            b[i, :] = int(start_color[2] + (end_color[2] - start_color[2]) * ratio)
-            alpha[i, :] = int(255 * ratio)
+        try:
+            return ImageFont.truetype(font_path, size)
+        except OSError as e:
+            logger.error(f"Ошибка загрузки шрифта {font_name}: {e}")
+            return ImageFont.load_default()
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при загрузке шрифта: {e}")
+            return ImageFont.load_default()
+    
+    def get(self, size: int, font_name: str = DEFAULT_FONT) -> ImageFont.FreeTypeFont:
+        """Шрифт нужного размера (общий экземпляр)"""
+        key = (font_name, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self.hits += 1
+                self._fonts.move_to_end(key)
+                return font
+            self.misses += 1
+            
+            start_time = time.perf_counter()
+            font = self._load(size, font_name)
+            self.load_times[key] = time.perf_counter() - start_time
+            
+            self._fonts[key] = font
+            while len(self._fonts) > self.max_fonts:
+                self._fonts.popitem(last=False)
+                self.evictions += 1
+            return font
+    
+    def preload(self, sizes: Optional[List[int]] = None, font_name: str = DEFAULT_FONT) -> None:
+        """Загрузка шрифтов заранее (по умолчанию - размеры из всех конфигураций)"""
+        if sizes is None:
+            sizes = sorted({plan.font_size for plan in RENDER_PLANS.values()})
+        for size in sizes:
+            self.get(size, font_name)
+    
+    def stats(self) -> dict:
+        """Статистика реестра: попадания, промахи и время загрузки (сек)"""
+        with self._lock:
+            return {
+                'fonts': len(self._fonts),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'load_times': {f"{name}@{size}": seconds for (name, size), seconds in self.load_times.items()},
+            }
+
+FONT_REGISTRY = FontRegistry(FONT_CACHE_SIZE)
+
+def get_font(size: int, font_name: str = DEFAULT_FONT) -> ImageFont.FreeTypeFont:
+    """Загрузка шрифта через общий реестр процесса"""
+    return FONT_REGISTRY.get(size, font_name)
+
+def _lanczos():
+    """Фильтр LANCZOS с учетом версии Pillow"""
+    if Resampling:
+        return Resampling.LANCZOS
+    resample = getattr(Image, 'LANCZOS', None)
+    if resample is None:
+        resample = getattr(Image, 'BICUBIC', 3)
+    return resample
+
+def _bilinear():
+    """Фильтр BILINEAR с учетом версии Pillow"""
+    if Resampling:
+        return Resampling.BILINEAR
+    return getattr(Image, 'BILINEAR', 2)
+
+def _target_dimensions(config: dict) -> Tuple[int, int]:
+    """Ширина и высота результата для конфигурации"""
+    if isinstance(config['target_size'], tuple):
+        return config['target_size']
+    return config['target_size'], config['target_size']
+
+def _readonly(array: np.ndarray) -> np.ndarray:
+    array.setflags(write=False)
+    return array
+
+class RenderPlan:
+    """Скомпилированная конфигурация варианта
+    
+    Все производные величины (геометрия, полоса градиента, координаты линий
+    сетки, позиции слоев, метрики строк) считаются один раз при компиляции.
+    План неизменяем; шрифт и метрики строк берутся из реестра при первом
+    обращении, чтобы компиляция не загружала шрифты.
+    """
+    __slots__ = (
+        'width', 'height', 'size', 'landscape', 'alignment',
+        'grad_height', 'grad_y', 'gradient_start', 'gradient_end',
+        'grid_square_size', 'grid_thickness', 'grid_opacity_ratio', 'grid_vertical_offset',
+        'grid_columns', 'grid_line_rows', 'grid_line_start',
+        'triangle_size', 'triangle_x', 'triangle_start', 'triangle_end',
+        'logo_size', 'logo_margin',
+        'text_margin', 'max_text_width', 'max_lines', 'font_size', 'line_spacing_ratio',
+        'frame_key', 'config_key', '_text_metrics',
+    )
+    
+    REQUIRED_KEYS = (
+        'target_size', 'gradient_height_ratio', 'triangle_size', 'grid_square_size',
+        'grid_line_thickness', 'grid_opacity_ratio', 'grid_vertical_offset', 'margins',
+        'font_size', 'line_spacing_ratio', 'gradient_colors',
+    )
+    
+    def __init__(self, config: dict):
+        self._validate(config)
+        init = lambda name, value: object.__setattr__(self, name, value)
+        
+        # Геометрия и выравнивание
+        width, height = _target_dimensions(config)
+        init('width', width)
+        init('height', height)
+        init('size', (width, height))
+        init('landscape', isinstance(config['target_size'], tuple))
+        init('alignment', config.get('image_alignment', 'bottom') if self.landscape else 'center')
+        
+        # Полоса градиента
+        colors = config['gradient_colors']
+        grad_height = int(height * config['gradient_height_ratio'])
+        init('grad_height', grad_height)
+        init('grad_y', height - grad_height)
+        init('gradient_start', tuple(colors['bottom']))
+        init('gradient_end', tuple(colors['bottom_end']))
+        
+        # Сетка: маска вертикальных линий и строки горизонтальных линий полосы
+        square = config['grid_square_size']
+        thickness = config['grid_line_thickness']
+        init('grid_square_size', square)
+        init('grid_thickness', thickness)
+        init('grid_opacity_ratio', config['grid_opacity_ratio'])
+        init('grid_vertical_offset', config['grid_vertical_offset'])
+        grid_start_x = (width % square) // 2
+        grid_start_y = self.grad_y + (square - grad_height % square) // 2 + config['grid_vertical_offset']
+        columns = np.zeros(width, dtype=bool)
+        for offset in range(thickness):
+            columns[grid_start_x + offset::square] = True
+        band_rows = np.arange(grad_height)
+        line_pos = band_rows - (grid_start_y - self.grad_y)
+        line_rows = (line_pos >= 0) & (line_pos % square < thickness)
+        # Вся толщина горизонтальной линии берет прозрачность своей первой строки
+        line_start = (band_rows - line_pos % square)[line_rows]
+        init('grid_columns', _readonly(columns))
+        init('grid_line_rows', _readonly(line_rows))
+        init('grid_line_start', _readonly(line_start))
+        
+        # Треугольник и логотип
+        init('triangle_size', config['triangle_size'])
+        init('triangle_x', width - config['triangle_size'])
+        init('triangle_start', tuple(colors['triangle_start']))
+        init('triangle_end', tuple(colors['triangle_end']))
+        init('logo_size', tuple(config['logo_size']) if config.get('logo_size') else None)
+        init('logo_margin', config['margins']['logo'])
         
-        # Объединяем каналы
-        gradient_array = np.stack([r, g, b, alpha], axis=-1).astype(np.uint8)
+        # Текст
+        init('text_margin', config['margins']['text'])
+        init('max_text_width', width - 2 * self.text_margin)
+        init('max_lines', config.get('max_lines'))
+        init('font_size', config['font_size'])
+        init('line_spacing_ratio', config['line_spacing_ratio'])
+        init('_text_metrics', None)
         
+        # Полный отпечаток конфигурации (для ключей кэша результатов)
+        init('config_key', _freeze(config))
+        
+        # Только параметры, влияющие на статичные слои рамки
+        init('frame_key', (
+            self.size, config['gradient_height_ratio'], square, thickness,
+            self.grid_opacity_ratio, self.grid_vertical_offset, self.triangle_size,
+            self.logo_margin, self.logo_size,
+            (self.gradient_start, self.gradient_end, self.triangle_start, self.triangle_end),
+        ))
+    
+    @classmethod
+    def _validate(cls, config: dict) -> None:
+        """Проверка конфигурации; ошибки - ImageProcessorError с понятным текстом"""
+        missing = [key for key in cls.REQUIRED_KEYS if key not in config]
+        if missing:
+            raise ImageProcessorError(f"В конфигурации нет ключей: {', '.join(missing)}")
+        
+        target_size = config['target_size']
+        sizes = target_size if isinstance(target_size, tuple) else (target_size, target_size)
+        if len(sizes) != 2 or not all(isinstance(value, int) and value > 0 for value in sizes):
+            raise ImageProcessorError(f"Некорректный target_size: {target_size!r}")
+        if not 0 < config['gradient_height_ratio'] <= 1:
+            raise ImageProcessorError("gradient_height_ratio должен быть в диапазоне (0, 1]")
+        if not 0 <= config['grid_opacity_ratio'] <= 1:
+            raise ImageProcessorError("grid_opacity_ratio должен быть в диапазоне [0, 1]")
+        for key in ('grid_square_size', 'grid_line_thickness', 'triangle_size', 'font_size'):
+            if not isinstance(config[key], int) or config[key] <= 0:
+                raise ImageProcessorError(f"{key} должен быть положительным целым числом")
+        if config['grid_line_thickness'] > config['grid_square_size']:
+            raise ImageProcessorError("grid_line_thickness больше grid_square_size")
+        if not {'text', 'logo'} <= set(config['margins']):
+            raise ImageProcessorError("margins должен содержать отступы 'text' и 'logo'")
+        if 2 * config['margins']['text'] >= sizes[0]:
+            raise ImageProcessorError("Отступы текста не оставляют места для строки")
+        for name in ('bottom', 'bottom_end', 'triangle_start', 'triangle_end'):
+            color = config['gradient_colors'].get(name)
+            if color is None or len(color) != 3:
+                raise ImageProcessorError(f"gradient_colors['{name}'] должен быть цветом RGB")
+        if config.get('max_lines') is not None and config['max_lines'] < 1:
+            raise ImageProcessorError("max_lines должен быть не меньше 1")
+        if isinstance(target_size, tuple) and config.get('image_alignment', 'bottom') not in IMAGE_ALIGNMENTS:
+            raise ImageProcessorError(f"Неизвестное выравнивание: {config.get('image_alignment')!r}")
+    
+    def __setattr__(self, name, value):
+        raise AttributeError('RenderPlan неизменяем')
+    
+    @property
+    def font(self) -> ImageFont.FreeTypeFont:
+        """Шрифт текста (из общего реестра процесса)"""
+        return get_font(self.font_size)
+    
+    @property
+    def text_metrics(self) -> Tuple[int, int]:
+        """Высота строки и межстрочный интервал"""
+        if self._text_metrics is None:
+            bbox = self.font.getbbox('Ay')
+            line_height = bbox[3] - bbox[1]
+            object.__setattr__(self, '_text_metrics', (line_height, int(line_height * self.line_spacing_ratio)))
+        return self._text_metrics
+
+def _freeze(value):
+    """Хешируемое представление конфигурации (словари и списки -> кортежи)"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+_render_plans = OrderedDict()
+_render_plans_lock = threading.Lock()
+
+def get_render_plan(config: Union[dict, RenderPlan]) -> RenderPlan:
+    """План для конфигурации: компилируется и проверяется при первом обращении"""
+    if isinstance(config, RenderPlan):
+        return config
+    key = _freeze(config)
+    with _render_plans_lock:
+        plan = _render_plans.get(key)
+        if plan is not None:
+            _render_plans.move_to_end(key)
+            return plan
+    
+    plan = RenderPlan(config)
+    with _render_plans_lock:
+        _render_plans[key] = plan
+        while len(_render_plans) > RENDER_PLAN_CACHE_SIZE:
+            _render_plans.popitem(last=False)
+    return plan
+
+def scale_config(config: dict, scale: float, logo_size: Optional[Tuple[int, int]] = None) -> dict:
+    """Копия конфигурации со всеми размерами в пикселях, умноженными на scale
+    
+    logo_size - исходный размер логотипа для конфигураций без 'logo_size'
+    (квадрат), чтобы логотип тоже уменьшился.
+    """
+    px = lambda value: max(int(round(value * scale)), 1)
+    target_size = config['target_size']
+    logo_size = config.get('logo_size') or logo_size
+    return dict(
+        config,
+        target_size=tuple(px(value) for value in target_size) if isinstance(target_size, tuple) else px(target_size),
+        triangle_size=px(config['triangle_size']),
+        grid_square_size=px(config['grid_square_size']),
+        grid_line_thickness=px(config['grid_line_thickness']),
+        grid_vertical_offset=int(round(config['grid_vertical_offset'] * scale)),
+        margins={name: px(value) for name, value in config['margins'].items()},
+        font_size=px(config['font_size']),
+        logo_size=tuple(px(value) for value in logo_size) if logo_size else None,
+    )
+
+# Встроенные варианты компилируются (и проверяются) при импорте
+RENDER_PLANS = {name: get_render_plan(config) for name, config in VARIANTS.items()}
+
+class LogoAssets:
+    """Логотип из папки logo/, загруженный один раз, и его готовые варианты по размерам
+    
+    При каждом обращении сверяет путь, время изменения и размер файла: если
+    логотип на диске заменили, кэш сбрасывается и логотип загружается заново.
+    """
+    
+    def __init__(self, logo_dir: str = None):
+        self.logo_dir = logo_dir
+        self._signature = None
+        self._logo = None
+        self._variants = {}
+        self._lock = threading.Lock()
+    
+    def _current_signature(self) -> Optional[tuple]:
+        logo_files = glob.glob(os.path.join(self.logo_dir or LOGO_DIR, '*'))
+        if not logo_files:
+            return None
+        stat = os.stat(logo_files[0])
+        return logo_files[0], stat.st_mtime_ns, stat.st_size
+    
+    def logo(self) -> Optional[Image.Image]:
+        """Логотип в RGBA (None, если логотипа нет или его не удалось открыть)"""
+        try:
+            signature = self._current_signature()
+        except OSError as e:
+            logger.error(f"Ошибка доступа к логотипу: {e}")
+            signature = None
+        
+        with self._lock:
+            if signature != self._signature:
+                self._signature = signature
+                self._variants = {}
+                self._logo = safe_open_image(signature[0]) if signature else None
+                if self._logo is not None:
+                    logger.info(f"Логотип загружен: {signature[0]}")
+            return self._logo
+    
+    def resized(self, logo_img: Image.Image, size: Optional[Tuple[int, int]]) -> Image.Image:
+        """Логотип нужного размера; для логотипа сервиса вариант считается один раз"""
+        if not size:
+            return logo_img
+        size = tuple(size)
+        with self._lock:
+            if logo_img is not self._logo:
+                return logo_img.resize(size, _lanczos())
+            variant = self._variants.get(size)
+            if variant is None:
+                variant = logo_img.resize(size, _lanczos())
+                self._variants[size] = variant
+            return variant
+    
+    def variant(self, size: Optional[Tuple[int, int]] = None) -> Optional[Image.Image]:
+        """Готовый к наложению логотип нужного размера (None - исходный)"""
+        logo_img = self.logo()
+        if logo_img is None:
+            return None
+        return self.resized(logo_img, size)
+    
+    def preload(self, configs: Optional[List[dict]] = None) -> Optional[Image.Image]:
+        """Загрузка логотипа и всех вариантов размеров из конфигураций"""
+        for config in configs or [CONFIG, CONFIG_LANDSCAPE_CENTER, CONFIG_LANDSCAPE_TOP, CONFIG_LANDSCAPE_BOTTOM]:
+            self.variant(get_render_plan(config).logo_size)
+        return self.logo()
+
+LOGO_ASSETS = LogoAssets()
+
+@lru_cache(maxsize=GRADIENT_CACHE_SIZE)
+def _gradient_array(width: int, height: int, start_color: Tuple[int, int, int],
+                    end_color: Tuple[int, int, int], reverse: bool) -> np.ndarray:
+    """Кэшируемый RGBA-массив градиента (только для чтения)"""
+    # Коэффициент для каждой строки
+    ratio = np.linspace(0, 1, height)
+    if reverse:
+        # Градиент снизу вверх (плотный вверху, затухает к низу)
+        ratio = ratio[::-1]
+    
+    # Цвет и прозрачность одной строки: внешнее произведение (height x 4)
+    start = np.array(start_color + (0,), dtype=np.float64)
+    delta = np.array(end_color + (255,), dtype=np.float64) - start
+    column = (start + ratio[:, None] * delta).astype(np.uint8)
+    
+    # Растягиваем столбец на всю ширину сразу в uint8
+    gradient_array = np.empty((height, width, 4), dtype=np.uint8)
+    gradient_array[:] = column[:, None, :]
+    gradient_array.flags.writeable = False
+    return gradient_array
+
+def create_gradient_optimized(width: int, height: int, start_color: Tuple[int, int, int], 
+                            end_color: Tuple[int, int, int], reverse: bool = False) -> Image.Image:
+    """Оптимизированное создание градиента с использованием numpy и кэша"""
+    try:
+        gradient_array = _gradient_array(width, height, tuple(start_color), tuple(end_color), bool(reverse))
+        # Изображение ссылается на кэшированный буфер и копируется при первом изменении
         return Image.fromarray(gradient_array)
     
     except Exception as e:
@@ -199,19 +728,400 @@ def create_gradient_fallback(width: int, height: int, start_color: Tuple[int, in
     
     return grad
 
+def render_grid_layer(plan: Union[dict, RenderPlan]) -> Image.Image:
+    """Векторизованная отрисовка слоя сетки (белые линии с прозрачностью по градиенту)"""
+    plan = get_render_plan(plan)
+    width, grad_height, grad_y = plan.width, plan.grad_height, plan.grad_y
+    
+    # Прозрачность белого градиента для сетки по строкам полосы
+    grid_alpha = _gradient_array(width, grad_height, (255, 255, 255), (255, 255, 255), False)[:, 0, 3]
+    rows = (np.arange(grad_height) / grad_height * grad_height).astype(np.intp)
+    row_alpha = (grid_alpha[rows] * plan.grid_opacity_ratio).astype(np.uint8)
+    
+    layer = np.zeros((plan.height, width, 4), dtype=np.uint8)
+    band = layer[grad_y:]
+    
+    # Маска вертикальных линий: каждая строка получает свою прозрачность
+    band[:, plan.grid_columns, :3] = 255
+    band[:, plan.grid_columns, 3] = row_alpha[:, None]
+    
+    # Горизонтальные линии перекрывают вертикальные
+    band[plan.grid_line_rows, :, :3] = 255
+    band[plan.grid_line_rows, :, 3] = row_alpha[plan.grid_line_start][:, None]
+    
+    return Image.fromarray(layer)
+
+def create_triangle_layer(plan: Union[dict, RenderPlan]) -> Image.Image:
+    """Треугольник в правом верхнем углу: градиент с треугольной маской"""
+    plan = get_render_plan(plan)
+    triangle_size = plan.triangle_size
+    tri_grad = create_gradient_optimized(
+        triangle_size, triangle_size,
+        plan.triangle_start,
+        plan.triangle_end
+    )
+    tri_mask = Image.new('L', (triangle_size, triangle_size), 0)
+    tri_mask_draw = ImageDraw.Draw(tri_mask)
+    tri_mask_draw.polygon([
+        (triangle_size, 0), 
+        (triangle_size, triangle_size), 
+        (0, 0)
+    ], fill=255)
+    tri_grad.putalpha(tri_mask)
+    return tri_grad
+
+def _stack_layers(width: int, height: int, layers: List[Tuple[np.ndarray, Tuple[int, int]]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Накладывает RGBA-слои друг на друга и возвращает премультиплицированный результат
+    
+    Цвет хранится как uint16 в масштабе 255*255, прозрачность - как uint8.
+    """
+    color = np.zeros((height, width, 3), dtype=np.float32)
+    alpha = np.zeros((height, width), dtype=np.float32)
+    
+    for rgba, (x, y) in layers:
+        # Обрезаем слой по границам холста
+        left, top = max(x, 0), max(y, 0)
+        right = min(x + rgba.shape[1], width)
+        bottom = min(y + rgba.shape[0], height)
+        if left >= right or top >= bottom:
+            continue
+        part = rgba[top - y:bottom - y, left - x:right - x].astype(np.float32)
+        a = part[..., 3] / 255
+        region_color = color[top:bottom, left:right]
+        region_alpha = alpha[top:bottom, left:right]
+        region_color *= (1 - a)[..., None]
+        region_color += part[..., :3] * a[..., None]
+        region_alpha *= 1 - a
+        region_alpha += a
+    
+    return np.rint(color * 255).astype(np.uint16), np.rint(alpha * 255).astype(np.uint8)
+
+def _composite_premultiplied(dst: np.ndarray, color: np.ndarray, alpha: np.ndarray) -> None:
+    """Накладывает премультиплицированный слой на массив RGB/RGBA (на месте)
+    
+    Обработка идет полосами по COMPOSITE_CHUNK_ROWS строк, чтобы промежуточные
+    буферы uint16 не занимали память размером с весь кадр.
+    """
+    for top in range(0, dst.shape[0], COMPOSITE_CHUNK_ROWS):
+        rows = slice(top, top + COMPOSITE_CHUNK_ROWS)
+        _composite_rows(dst[rows], color[rows], alpha[rows])
+
+def _composite_rows(dst: np.ndarray, color: np.ndarray, alpha: np.ndarray) -> None:
+    """Наложение для одной полосы строк"""
+    inverse = 255 - alpha.astype(np.uint16)
+    rgb = dst[..., :3].astype(np.uint16)
+    rgb *= inverse[..., None]
+    rgb += color
+    rgb += 127
+    rgb //= 255
+    dst[..., :3] = rgb
+    if dst.shape[2] == 4:
+        dst_alpha = dst[..., 3].astype(np.uint16)
+        dst_alpha *= inverse
+        dst_alpha += 127
+        dst_alpha //= 255
+        dst[..., 3] = dst_alpha + alpha
+
+def _layer_box(rgba: np.ndarray, position: Tuple[int, int], width: int, height: int) -> Optional[Tuple[int, int, int, int]]:
+    """Область слоя на холсте (обрезанная по границам) или None, если слой вне холста"""
+    x, y = position
+    box = (max(x, 0), max(y, 0), min(x + rgba.shape[1], width), min(y + rgba.shape[0], height))
+    return box if box[0] < box[2] and box[1] < box[3] else None
+
+def _layer_regions(width: int, height: int,
+                   layers: List[Tuple[np.ndarray, Tuple[int, int]]]) -> List[Tuple[Tuple[int, int, int, int], Tuple[np.ndarray, np.ndarray]]]:
+    """Разбивает стек слоев на прямоугольные области и рендерит каждую отдельно
+    
+    Пересекающиеся области слоев объединяются, поэтому порядок наложения внутри
+    области сохраняется. Возвращает [(область, (цвет, прозрачность))].
+    """
+    boxes = [box for box in (_layer_box(rgba, position, width, height) for rgba, position in layers) if box]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    boxes[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    
+    regions = []
+    for left, top, right, bottom in sorted(boxes, key=lambda box: (box[1], box[0])):
+        shifted = [(rgba, (x - left, y - top)) for rgba, (x, y) in layers]
+        regions.append(((left, top, right, bottom), _stack_layers(right - left, bottom - top, shifted)))
+    return regions
+
+def _composite_regions(img: Image.Image, regions: list) -> Image.Image:
+    """Накладывает области на изображение: пиксели вне областей не затрагиваются"""
+    for box, (color, alpha) in regions:
+        patch = np.array(img.crop(box))
+        _composite_premultiplied(patch, color, alpha)
+        img.paste(Image.fromarray(patch), box[:2])
+    return img
+
+class BrandFrame:
+    """Статичная рамка бренда (градиент, сетка, треугольник, логотип) для одной конфигурации
+    
+    Стек слоев рендерится один раз в премультиплицированные области: полосу
+    градиента с сеткой внизу и угол с треугольником и логотипом. При наложении
+    обрабатываются только эти области, остальная часть кадра не копируется.
+    """
+    
+    def __init__(self, plan: Union[dict, RenderPlan], logo_img: Image.Image):
+        plan = get_render_plan(plan)
+        width, height = plan.size
+        self.size = plan.size
+        
+        # Градиент по нижней части
+        grad_y = plan.grad_y
+        grad = _gradient_array(width, plan.grad_height, plan.gradient_start, plan.gradient_end, False)
+        
+        # Сетка поверх градиента
+        grid = np.asarray(render_grid_layer(plan))[grad_y:]
+        
+        # Треугольник с градиентом и маской
+        tri_grad = create_triangle_layer(plan)
+        tri_x = plan.triangle_x
+        
+        # Логотип (для ландшафта - с изменением размера)
+        logo = LOGO_ASSETS.resized(logo_img, plan.logo_size).convert('RGBA')
+        logo_x = width - logo.width - plan.logo_margin
+        logo_y = plan.logo_margin
+        
+        under_layers = [(grad, (0, grad_y)), (grid, (0, grad_y))]
+        over_layers = [(np.asarray(tri_grad), (tri_x, 0)), (np.asarray(logo), (logo_x, logo_y))]
+        
+        # Сначала полоса, после текста - угол (треугольник и логотип всегда лежат поверх текста)
+        self.under_regions = _layer_regions(width, height, under_layers)
+        self.over_regions = _layer_regions(width, height, over_layers)
+    
+    def composite(self, img: Image.Image) -> Image.Image:
+        """Накладывает полосу градиента с сеткой (на месте, только по ее области)"""
+        return _composite_regions(img, self.under_regions)
+    
+    def composite_overlay(self, img: Image.Image) -> Image.Image:
+        """Накладывает только треугольник и логотип (после текста)"""
+        return _composite_regions(img, self.over_regions)
+
+_brand_frames = OrderedDict()
+_brand_frames_lock = threading.Lock()
+
+def _logo_fingerprint(logo_img: Image.Image) -> tuple:
+    """Отпечаток содержимого логотипа для ключей кэша"""
+    return logo_img.size, logo_img.mode, hashlib.sha1(logo_img.tobytes()).hexdigest()
+
+def _brand_frame_key(plan: RenderPlan, logo_img: Image.Image) -> tuple:
+    """Ключ рамки: только параметры, влияющие на статичные слои"""
+    return _logo_fingerprint(logo_img), plan.frame_key
+
+def get_brand_frame(config: Union[dict, RenderPlan], logo_img: Image.Image) -> BrandFrame:
+    """Возвращает рамку бренда для конфигурации, создавая её при первом обращении"""
+    plan = get_render_plan(config)
+    key = _brand_frame_key(plan, logo_img)
+    with _brand_frames_lock:
+        frame = _brand_frames.get(key)
+        if frame is not None:
+            _brand_frames.move_to_end(key)
+            return frame
+    
+    start_time = time.time()
+    frame = BrandFrame(plan, logo_img)
+    logger.info(f"Рамка {plan.width}x{plan.height} подготовлена за {time.time() - start_time:.2f} сек")
+    
+    with _brand_frames_lock:
+        _brand_frames[key] = frame
+        while len(_brand_frames) > BRAND_FRAME_CACHE_SIZE:
+            _brand_frames.popitem(last=False)
+    return frame
+
+def preload_brand_frames(logo_img: Image.Image, configs: Optional[List[dict]] = None) -> None:
+    """Заранее готовит рамки для всех конфигураций (например, при запуске)"""
+    for config in configs or [CONFIG, CONFIG_LANDSCAPE_CENTER, CONFIG_LANDSCAPE_TOP, CONFIG_LANDSCAPE_BOTTOM]:
+        get_brand_frame(config, logo_img)
+
+class TextMeasurer:
+    """Быстрые измерения ширины строк для одного шрифта
+    
+    Ширина строки собирается из кэшированных метрик глифов и слов (сдвиг пера и
+    границы заливки), поэтому измерение не требует повторной раскладки всей строки
+    через font.getbbox. Для простой раскладки FreeType результат совпадает с
+    getbbox; кернинг учитывается по парам, если шрифт его применяет. Строки,
+    ширина которых ближе guard пикселей к границе, перепроверяются точно.
+    """
+    
+    # Пары для проверки, применяет ли шрифт кернинг
+    KERNING_PROBES = ('AV', 'To', 'Ta', 'LT', 'Yo', 'ТА', 'Го', 'Уо', 'Г.', 'Р.')
+    
+    def __init__(self, font):
+        self.font = font
+        self._glyphs = {}
+        self._extents = OrderedDict()
+        self._exact = OrderedDict()
+        self._pairs = {}
+        self.supported = hasattr(font, 'getlength') and hasattr(font, 'getbbox')
+        self.kerning = False
+        self.guard = 1
+        if self.supported:
+            raqm = getattr(ImageFont, 'Layout', None) and getattr(font, 'layout_engine', None) == ImageFont.Layout.RAQM
+            self.kerning = bool(raqm) or any(
+                font.getlength(pair) != font.getlength(pair[0]) + font.getlength(pair[1])
+                for pair in self.KERNING_PROBES
+            )
+            if raqm:
+                # Сложная раскладка (лигатуры) точнее проверяется напрямую
+                self.guard = max(1, getattr(font, 'size', 0) // 4)
+    
+    def _glyph(self, char: str) -> tuple:
+        """(сдвиг пера, левая и правая граница заливки) одного символа"""
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            left, _, right, _ = self.font.getbbox(char)
+            glyph = (self.font.getlength(char), left, right) if right > left else (self.font.getlength(char), None, None)
+            self._glyphs[char] = glyph
+        return glyph
+    
+    def _kern(self, first: str, second: str) -> float:
+        """Кернинг пары символов (0, если шрифт его не применяет)"""
+        if not self.kerning:
+            return 0
+        pair = first + second
+        kern = self._pairs.get(pair)
+        if kern is None:
+            kern = self.font.getlength(pair) - self.font.getlength(first) - self.font.getlength(second)
+            self._pairs[pair] = kern
+        return kern
+    
+    def _join(self, head: Optional[tuple], tail: Optional[tuple]) -> Optional[tuple]:
+        """Склейка метрик двух фрагментов: (сдвиг, лево, право, первый, последний символ)"""
+        if head is None:
+            return tail
+        if tail is None:
+            return head
+        offset = head[0] + self._kern(head[4], tail[3])
+        left, right = head[1], head[2]
+        if tail[1] is not None:
+            left = tail[1] + offset if left is None else min(left, tail[1] + offset)
+            right = tail[2] + offset if right is None else max(right, tail[2] + offset)
+        return (offset + tail[0], left, right, head[3], tail[4])
+    
+    def extent(self, text: str) -> Optional[tuple]:
+        """Метрики фрагмента текста (кэшируются для слов)"""
+        if not text:
+            return None
+        cached = self._extents.get(text)
+        if cached is not None:
+            self._extents.move_to_end(text)
+            return cached
+        result = None
+        for char in text:
+            advance, left, right = self._glyph(char)
+            result = self._join(result, (advance, left, right, char, char))
+        self._extents[text] = result
+        if len(self._extents) > TEXT_MEASURE_CACHE_SIZE:
+            self._extents.popitem(last=False)
+        return result
+    
+    @staticmethod
+    def span(extent: Optional[tuple]) -> float:
+        """Ширина заливки по метрикам (как bbox[2] - bbox[0])"""
+        if extent is None or extent[1] is None:
+            return 0
+        return extent[2] - extent[1]
+    
+    def exact_width(self, text: str) -> int:
+        """Точная ширина через font.getbbox (с кэшем)"""
+        width = self._exact.get(text)
+        if width is None:
+            bbox = self.font.getbbox(text)
+            width = bbox[2] - bbox[0]
+            self._exact[text] = width
+            if len(self._exact) > TEXT_MEASURE_CACHE_SIZE:
+                self._exact.popitem(last=False)
+        return width
+    
+    def fits(self, text: str, max_width: int, extent: Optional[tuple] = None) -> bool:
+        """Помещается ли строка в max_width"""
+        if not self.supported:
+            return self.exact_width(text) <= max_width
+        width = self.span(extent if extent is not None else self.extent(text))
+        if abs(width - max_width) <= self.guard:
+            return self.exact_width(text) <= max_width
+        return width <= max_width
+    
+    def fit_prefix(self, text: str, start: int, max_width: int, suffix: str = '') -> int:
+        """Наибольшее k, при котором text[start:start + k] + suffix помещается в max_width
+        
+        Галопирующий поиск от начала и бинарный поиск внутри найденного отрезка;
+        метрики префиксов наращиваются по мере надобности, поэтому стоимость
+        пропорциональна длине ответа, а не длине всего текста.
+        """
+        suffix_extent = self.extent(suffix)
+        prefixes = [None]
+        
+        def fits(k: int) -> bool:
+            while len(prefixes) <= k:
+                char = text[start + len(prefixes) - 1]
+                advance, left, right = self._glyph(char)
+                prefixes.append(self._join(prefixes[-1], (advance, left, right, char, char)))
+            candidate = text[start:start + k] + suffix
+            return self.fits(candidate, max_width, self._join(prefixes[k], suffix_extent))
+        
+        count = len(text) - start
+        low, step = 0, 1
+        while low + step <= count and fits(low + step):
+            low += step
+            step *= 2
+        high = min(low + step, count + 1)
+        # Инвариант: fits(low) (или low == 0), not fits(high) (или high == count + 1)
+        while high - low > 1:
+            middle = (low + high) // 2
+            if fits(middle):
+                low = middle
+            else:
+                high = middle
+        return low
+
+_text_measurers = weakref.WeakKeyDictionary()
+_text_measurers_lock = threading.Lock()
+
+def get_text_measurer(font) -> TextMeasurer:
+    """Измеритель для шрифта (один на объект шрифта)"""
+    with _text_measurers_lock:
+        measurer = _text_measurers.get(font)
+        if measurer is None:
+            measurer = TextMeasurer(font)
+            _text_measurers[font] = measurer
+        return measurer
+
 def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: int, max_lines: int = None) -> List[str]:
-    """Улучшенный перенос текста с учетом границ шрифта, ограничения строк и принудительным переносом длинных слов"""
+    """Улучшенный перенос текста с учетом границ шрифта, ограничения строк и принудительным переносом длинных слов
+    
+    Переносы совпадают с посимвольной раскладкой через font.getbbox, но ширины
+    считаются по кэшированным метрикам слов, а длинные слова и многоточие
+    подбираются двоичным поиском.
+    """
+    measurer = get_text_measurer(font)
+    space = measurer.extent(' ')
     words = text.split()
     lines = []
     current_line = ''
+    current_extent = None
     
     for word in words:
-        test_line = current_line + (' ' if current_line else '') + word
-        bbox = font.getbbox(test_line)
-        w = bbox[2] - bbox[0]
+        word_extent = measurer.extent(word)
+        if current_line:
+            test_line = current_line + ' ' + word
+            test_extent = measurer._join(measurer._join(current_extent, space), word_extent)
+        else:
+            test_line, test_extent = word, word_extent
         
-        if w <= max_width:
-            current_line = test_line
+        if measurer.fits(test_line, max_width, test_extent):
+            current_line, current_extent = test_line, test_extent
         else:
             # Если текущая строка не пустая, добавляем её и начинаем новую
             if current_line:
@@ -219,42 +1129,19 @@ def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: int, max_lines
                 # Проверяем ограничение строк
                 if max_lines and len(lines) >= max_lines:
                     break
-                current_line = word
+                current_line, current_extent = word, word_extent
             else:
                 # Если текущая строка пустая, значит слово само по себе длинное
                 # Разбиваем длинное слово на части
                 if len(lines) < (max_lines or float('inf')):
-                    # Разбиваем слово посимвольно
-                    word_parts = []
-                    current_part = ''
+                    start = 0
+                    while start < len(word) and len(lines) < (max_lines or float('inf')):
+                        # Если даже один символ не помещается, добавляем его
+                        length = max(measurer.fit_prefix(word, start, max_width), 1)
+                        lines.append(word[start:start + length])
+                        start += length
                     
-                    for char in word:
-                        test_part = current_part + char
-                        bbox = font.getbbox(test_part)
-                        part_width = bbox[2] - bbox[0]
-                        
-                        if part_width <= max_width:
-                            current_part = test_part
-                        else:
-                            if current_part:
-                                word_parts.append(current_part)
-                                current_part = char
-                            else:
-                                # Если даже один символ не помещается, добавляем его
-                                word_parts.append(char)
-                                current_part = ''
-                    
-                    if current_part:
-                        word_parts.append(current_part)
-                    
-                    # Добавляем части слова в строки
-                    for i, part in enumerate(word_parts):
-                        if len(lines) < (max_lines or float('inf')):
-                            lines.append(part)
-                        else:
-                            break
-                    
-                    current_line = ''
+                    current_line, current_extent = '', None
                     continue
                 else:
                     break
@@ -265,322 +1152,1416 @@ def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: int, max_lines
     # Если превышено ограничение строк, добавляем многоточие к последней строке
     if max_lines and len(lines) >= max_lines and lines:
         last_line = lines[-1]
-        # Проверяем, поместится ли многоточие
         ellipsis = "..."
-        test_line = last_line + ellipsis
-        bbox = font.getbbox(test_line)
-        w = bbox[2] - bbox[0]
+        # Сколько символов последней строки можно оставить вместе с многоточием
+        keep = measurer.fit_prefix(last_line, 0, max_width, ellipsis)
+        lines[-1] = last_line[:keep] + ellipsis
+    
+    return lines
+
+class TextLayer:
+    """Перенесенный и растеризованный заголовок: маска покрытия белым цветом
+    
+    offset - сдвиг маски относительно точки начала первой строки (глифы могут
+    выступать влево и вверх), height - высота блока текста по метрикам строк.
+    """
+    __slots__ = ('lines', 'height', 'mask', 'offset')
+    
+    def __init__(self, user_text: str, plan: RenderPlan):
+        font = plan.font
+        self.lines = wrap_text(user_text, font, plan.max_text_width, plan.max_lines)
+        line_height, line_spacing = plan.text_metrics
+        self.height = len(self.lines) * line_height + (len(self.lines) - 1) * line_spacing
+        
+        # Границы всех строк относительно начала первой
+        positions = [(0, index * (line_height + line_spacing)) for index in range(len(self.lines))]
+        boxes = [font.getbbox(line) for line in self.lines]
+        boxes = [(x + box[0], y + box[1], x + box[2], y + box[3])
+                 for (x, y), box, line in zip(positions, boxes, self.lines) if line]
+        if not boxes:
+            self.mask, self.offset = None, (0, 0)
+            return
+        left = min(box[0] for box in boxes)
+        top = min(box[1] for box in boxes)
+        right = max(box[2] for box in boxes)
+        bottom = max(box[3] for box in boxes)
         
-        if w <= max_width:
-            lines[-1] = test_line
+        self.mask = Image.new('L', (right - left, bottom - top), 0)
+        draw = ImageDraw.Draw(self.mask)
+        for (x, y), line in zip(positions, self.lines):
+            draw.text((x - left, y - top), line, font=font, fill=255)
+        self.offset = (left, top)
+    
+    def paste(self, img: Image.Image, origin: Tuple[int, int]) -> None:
+        """Заливает текст белым одной операцией (на месте)"""
+        if self.mask is not None:
+            img.paste((255, 255, 255), (origin[0] + self.offset[0], origin[1] + self.offset[1]), self.mask)
+
+_text_layers = OrderedDict()
+_text_layers_lock = threading.Lock()
+
+def get_text_layer(user_text: str, config: Union[dict, RenderPlan]) -> TextLayer:
+    """Растеризованный заголовок для конфигурации (общий для вариантов с тем же шрифтом и шириной)
+    
+    Ключ - текст, шрифт, ширина блока, число строк и межстрочный интервал,
+    поэтому три ландшафта с разным выравниванием растеризуют текст один раз.
+    """
+    plan = get_render_plan(config)
+    font = plan.font
+    key = (user_text, getattr(font, 'path', None), plan.font_size, plan.max_text_width,
+           plan.max_lines, plan.line_spacing_ratio)
+    with _text_layers_lock:
+        layer = _text_layers.get(key)
+        if layer is not None:
+            _text_layers.move_to_end(key)
+            return layer
+    
+    layer = TextLayer(user_text, plan)
+    with _text_layers_lock:
+        _text_layers[key] = layer
+        while len(_text_layers) > TEXT_LAYER_CACHE_SIZE:
+            _text_layers.popitem(last=False)
+    return layer
+
+class SourceImage:
+    """Исходное фото, декодированное один раз, с общими буферами масштабирования
+    
+    Все варианты (квадрат и ландшафты с разным выравниванием) получают кадры из
+    общих уменьшенных копий: каждый уникальный масштаб считается один раз, а
+    меньшие масштабы берутся из уже уменьшенного буфера, а не из оригинала.
+    """
+    
+    def __init__(self, image: Image.Image):
+        self.image = image
+        self._resized = {}
+        self._lock = threading.Lock()
+        self._row_energy = None
+    
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.image.size
+    
+    def fit(self, target_width: int, target_height: int) -> Image.Image:
+        """Изображение, масштабированное так, чтобы покрыть целевой размер (общий буфер)"""
+        orig_w, orig_h = self.image.size
+        scale = max(target_width / orig_w, target_height / orig_h)
+        new_size = (int(orig_w * scale), int(orig_h * scale))
+        
+        with self._lock:
+            resized = self._resized.get(new_size)
+            if resized is None:
+                # Берем наименьший уже готовый буфер, который не меньше нужного и
+                # сам получен уменьшением оригинала
+                source = self.image
+                for size, candidate in self._resized.items():
+                    if (new_size[0] <= size[0] <= orig_w and new_size[1] <= size[1] <= orig_h
+                            and size[0] * size[1] < source.width * source.height):
+                        source = candidate
+                resized = source.resize(new_size, _lanczos())
+                self._resized[new_size] = resized
+        return resized
+    
+    def crop(self, config: Union[dict, RenderPlan]) -> Image.Image:
+        """Кадр нужного размера с выравниванием из конфигурации"""
+        plan = get_render_plan(config)
+        target_width, target_height = plan.size
+        resized = self.fit(target_width, target_height)
+        new_w, new_h = resized.size
+        
+        # Обрезка и выравнивание
+        left = (new_w - target_width) // 2
+        if plan.landscape:
+            # Для ландшафта выбираем выравнивание
+            alignment = plan.alignment
+            logger.info(f"Выравнивание ландшафта: {alignment}")
+            if alignment == 'top':
+                top = 0  # Выравнивание по верху
+                logger.info("Применено выравнивание по верху")
+            elif alignment == 'center':
+                top = (new_h - target_height) // 2  # Выравнивание по центру
+                logger.info("Применено выравнивание по центру")
+            elif alignment == 'auto':
+                top = self.auto_offset(plan, new_h)  # По карте значимости
+                logger.info(f"Применено автоматическое выравнивание: сдвиг {top} из {new_h - target_height} px")
+            else:  # bottom
+                top = new_h - target_height  # Выравнивание по нижнему краю
+                logger.info("Применено выравнивание по низу")
         else:
-            # Если многоточие не помещается, убираем последние символы
-            while last_line and w > max_width:
-                last_line = last_line[:-1]
-                test_line = last_line + ellipsis
-                bbox = font.getbbox(test_line)
-                w = bbox[2] - bbox[0]
-            lines[-1] = test_line
+            # Для квадрата центрируем
+            top = (new_h - target_height) // 2
+        
+        return resized.crop((left, top, left + target_width, top + target_height))
     
-    return lines
+    def row_energy(self) -> np.ndarray:
+        """Значимость строк фото по уменьшенной копии (считается один раз)
+        
+        Энергия пикселя - модуль градиента яркости плюс отличие цвета от
+        среднего по кадру: так выделяются и контуры, и яркие объекты на фоне.
+        """
+        with self._lock:
+            if self._row_energy is None:
+                scale = SALIENCY_SIZE / max(self.image.size)
+                small_size = (max(int(self.image.width * scale), 1), max(int(self.image.height * scale), 1))
+                small = self.image.resize(small_size, _bilinear(), reducing_gap=2.0)
+                small = np.asarray(small.convert('RGB'), dtype=np.float32)
+                luma = small @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+                energy = np.zeros_like(luma)
+                energy[:, 1:] += np.abs(np.diff(luma, axis=1))
+                energy[1:] += np.abs(np.diff(luma, axis=0))
+                energy += 0.5 * np.abs(small - small.reshape(-1, 3).mean(axis=0)).sum(axis=2)
+                self._row_energy = energy.mean(axis=1)
+            return self._row_energy
+    
+    def auto_offset(self, plan: RenderPlan, resized_height: int) -> int:
+        """Вертикальный сдвиг кадра, при котором значимое содержимое остается
+        в открытой части, а не под полосой градиента с текстом
+        
+        Значимость под полосой штрафуется сильнее, чем обрезанная за кадром:
+        закрыть объект текстом хуже, чем потерять край фото.
+        """
+        slack = resized_height - plan.height
+        if slack <= 0:
+            return 0
+        
+        # Накопленная энергия в координатах уменьшенного буфера
+        rows = self.row_energy()
+        cumulative = np.concatenate(([0.0], np.cumsum(rows)))
+        energy_to = lambda y: np.interp(y * len(rows) / resized_height, np.arange(len(rows) + 1), cumulative)
+        
+        tops = np.unique(np.linspace(0, slack, min(slack + 1, 4 * len(rows))).astype(int))
+        clear = energy_to(tops + plan.grad_y) - energy_to(tops)
+        band = energy_to(tops + plan.height) - energy_to(tops + plan.grad_y)
+        outside = cumulative[-1] - clear - band
+        score = clear - SALIENCY_BAND_PENALTY * band - outside
+        # При равных оценках предпочитаем кадр ближе к центру
+        tie_break = np.abs(tops - slack / 2) / slack
+        score -= 1e-6 * (np.abs(score).max() + 1) * tie_break
+        return int(tops[np.argmax(score)])
+    
+    def prepare(self, configs: List[dict]) -> None:
+        """Заранее считает буферы для набора конфигураций: от крупного к мелкому"""
+        sizes = {get_render_plan(config).size for config in configs}
+        for target_width, target_height in sorted(sizes, key=lambda size: -max(
+                size[0] / self.image.width, size[1] / self.image.height)):
+            self.fit(target_width, target_height)
 
-def process_single_image_social_only(img_path: str, logo_img: Image.Image, user_text: str) -> bool:
+class _Span:
+    """Замер одного этапа; при выходе время добавляется в запись задачи"""
+    __slots__ = ('timings', 'stage', 'variant', 'start')
+    
+    def __init__(self, timings: 'StageTimings', stage: str, variant: Optional[str]):
+        self.timings = timings
+        self.stage = stage
+        self.variant = variant
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.timings.add(self.stage, time.perf_counter() - self.start, self.variant)
+        return False
+
+class _NoSpan:
+    """Пустой замер, когда инструментирование выключено"""
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+class StageTimings:
+    """Разбивка времени одной задачи по этапам (сек)
+    
+    stages - суммы по этапам за всю задачу, variants - те же суммы по каждому
+    варианту. Запись потокобезопасна: кодирование идет в пуле потоков.
+    """
+    
+    def __init__(self):
+        self.stages = {}
+        self.variants = {}
+        self.peak_memory_mb = None
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._peak_window = None
+    
+    def span(self, stage: str, variant: Optional[str] = None) -> _Span:
+        return _Span(self, stage, variant)
+    
+    def add(self, stage: str, seconds: float, variant: Optional[str] = None) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            if variant is not None:
+                stages = self.variants.setdefault(variant, {})
+                stages[stage] = stages.get(stage, 0.0) + seconds
+    
+    def as_dict(self) -> dict:
+        """Структурированная запись: {'stages': {...}, 'variants': {вариант: {...}}, 'peak_memory_mb'}
+        
+        peak_memory_mb есть в записи, только если пик задачи удалось измерить.
+        """
+        with self._lock:
+            record = {
+                'stages': dict(self.stages),
+                'variants': {name: dict(stages) for name, stages in self.variants.items()},
+            }
+            if self.peak_memory_mb is not None:
+                record['peak_memory_mb'] = self.peak_memory_mb
+            return record
+
+def _reset_peak_memory() -> bool:
+    """Сбрасывает пик RSS процесса (Linux); False, если сбросить не удалось"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_memory_mb() -> Optional[float]:
+    """Пик RSS процесса в МБ с последнего сброса (VmHWM) или None
+    
+    ru_maxrss не подходит: это пик за всю жизнь процесса, он не сбрасывается.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def _span(timings: Optional[StageTimings], stage: str, variant: Optional[str] = None):
+    """Замер этапа или пустой контекст, если запись не ведется"""
+    return _NO_SPAN if timings is None else _Span(timings, stage, variant)
+
+class StageHistograms:
+    """Гистограммы времени этапов по всем задачам процесса"""
+    
+    def __init__(self, bounds: Tuple[float, ...] = STAGE_HISTOGRAM_BOUNDS):
+        self.bounds = bounds
+        self._lock = threading.Lock()
+        self._stages = {}
+    
+    def record(self, stages: Dict[str, float]) -> None:
+        """Добавляет разбивку одной задачи {этап: сек}"""
+        with self._lock:
+            for stage, seconds in stages.items():
+                stats = self._stages.get(stage)
+                if stats is None:
+                    stats = self._stages[stage] = {
+                        'count': 0, 'seconds': 0.0, 'max': 0.0,
+                        'buckets': [0] * (len(self.bounds) + 1),
+                    }
+                stats['count'] += 1
+                stats['seconds'] += seconds
+                stats['max'] = max(stats['max'], seconds)
+                stats['buckets'][bisect.bisect_left(self.bounds, seconds)] += 1
+    
+    def _quantile(self, stats: dict, q: float) -> float:
+        """Оценка квантиля по верхней границе корзины"""
+        rank = q * stats['count']
+        seen = 0
+        for index, count in enumerate(stats['buckets']):
+            seen += count
+            if count and seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else stats['max']
+        return stats['max']
+    
+    def summary(self) -> dict:
+        """{этап: {'count', 'seconds', 'avg_seconds', 'p50', 'p95', 'max', 'buckets'}}"""
+        with self._lock:
+            return {
+                stage: {
+                    'count': stats['count'],
+                    'seconds': stats['seconds'],
+                    'avg_seconds': stats['seconds'] / stats['count'],
+                    'p50': self._quantile(stats, 0.5),
+                    'p95': self._quantile(stats, 0.95),
+                    'max': stats['max'],
+                    'buckets': list(stats['buckets']),
+                }
+                for stage, stats in self._stages.items()
+            }
+    
+    def log_summary(self) -> None:
+        """Пишет в лог этапы, отсортированные по суммарному времени"""
+        summary = self.summary()
+        for stage, stats in sorted(summary.items(), key=lambda item: item[1]['seconds'], reverse=True):
+            logger.info(f"Этап {stage}: {stats['count']} раз, среднее {stats['avg_seconds']:.3f} сек, "
+                        f"p95 <= {stats['p95']:.3f} сек, макс {stats['max']:.3f} сек")
+
+STAGE_HISTOGRAMS = StageHistograms()
+
+# Пик памяти общий на процесс: задача меряет его, только если шла одна
+_peak_lock = threading.Lock()
+_jobs_in_flight = 0
+_jobs_started = 0
+
+def _begin_peak_window() -> Optional[int]:
+    """Начало задачи: сброс пика, если других задач нет; номер задачи или None
+    
+    None и тогда, когда пик не удалось сбросить: иначе в задачу попал бы
+    пик всего процесса.
+    """
+    global _jobs_in_flight, _jobs_started
+    with _peak_lock:
+        _jobs_in_flight += 1
+        _jobs_started += 1
+        if _jobs_in_flight > 1 or not _reset_peak_memory():
+            return None
+        return _jobs_started
+
+def _end_peak_window(window: Optional[int]) -> Optional[float]:
+    """Конец задачи: пик, если за время задачи не запускались другие, иначе None"""
+    global _jobs_in_flight
+    with _peak_lock:
+        _jobs_in_flight -= 1
+        if window is None or window != _jobs_started:
+            return None
+        return _peak_memory_mb()
+
+def _timed_job(func):
+    """Инструментирование задачи рендеринга
+    
+    Если вызывающий не передал timings, запись создается здесь (при
+    STAGE_TIMING). Самый внешний вызов на записи добавляет этап 'total',
+    пиковую память процесса за время задачи и отправляет разбивку в
+    STAGE_HISTOGRAMS. Пик общий на процесс, поэтому он сбрасывается и
+    записывается, только если задача шла одна и пик удалось сбросить; при
+    параллельных задачах в потоках (бот) и вне Linux peak_memory_mb остается None.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, timings: Optional[StageTimings] = None, **kwargs):
+        if timings is None:
+            if not STAGE_TIMING:
+                return func(*args, timings=None, **kwargs)
+            timings = StageTimings()
+        if timings._depth == 0:
+            timings._peak_window = _begin_peak_window()
+        timings._depth += 1
+        start_time = time.perf_counter()
+        try:
+            return func(*args, timings=timings, **kwargs)
+        finally:
+            timings._depth -= 1
+            if timings._depth == 0:
+                timings.add('total', time.perf_counter() - start_time)
+                timings.peak_memory_mb = _end_peak_window(timings._peak_window)
+                STAGE_HISTOGRAMS.record(timings.stages)
+                if timings.peak_memory_mb is not None:
+                    logger.info(f"Пиковая память задачи {func.__name__}: {timings.peak_memory_mb:.0f} МБ")
+    return wrapper
+
+@_timed_job
+def process_single_image_social_only(img_path: str, logo_img: Image.Image, user_text: str,
+                                     output_dir: Optional[str] = None,
+                                     timings: Optional[StageTimings] = None) -> bool:
     """Обработка одного изображения только для соцсетей"""
     try:
-        with safe_open_image(img_path) as base:
-            if base is None:
-                return False
-            
-            # Создаем только изображение для соцсетей
-            success = process_image_with_config(base, logo_img, user_text, CONFIG, img_path, "square")
-            return success
+        _, remaining = _restore_cached_variants(img_path, logo_img, user_text, [(CONFIG, "square")], output_dir)
+        if not remaining:
+            return True
+        with _span(timings, 'decode'):
+            source = load_source_image(img_path, [CONFIG])
+        if source is None:
+            return False
+        
+        # Создаем только изображение для соцсетей
+        success = process_image_with_config(source, logo_img, user_text, CONFIG, img_path, "square",
+                                            output_dir=output_dir, timings=timings)
+        return success
             
     except Exception as e:
         logger.error(f"Ошибка обработки изображения {img_path}: {e}")
         return False
 
-def process_single_image_investor_only(img_path: str, logo_img: Image.Image, user_text: str) -> bool:
+@_timed_job
+def process_single_image_investor_only(img_path: str, logo_img: Image.Image, user_text: str,
+                                       output_dir: Optional[str] = None,
+                                       timings: Optional[StageTimings] = None) -> bool:
     """Обработка одного изображения только для инвестпортала (создает все варианты)"""
     try:
-        with safe_open_image(img_path) as base:
-            if base is None:
-                return False
-            
-            # Создаем только варианты для инвестпортала
-            success_count = 0
-            
-            landscape_configs = [
-                (CONFIG_LANDSCAPE_CENTER, "landscape_center"),
-                (CONFIG_LANDSCAPE_TOP, "landscape_top"),
-                (CONFIG_LANDSCAPE_BOTTOM, "landscape_bottom")
-            ]
-            
-            for config, suffix in landscape_configs:
-                if process_image_with_config(base, logo_img, user_text, config, img_path, suffix):
-                    success_count += 1
-            
-            return success_count > 0
+        landscape_configs = [
+            (CONFIG_LANDSCAPE_CENTER, "landscape_center"),
+            (CONFIG_LANDSCAPE_TOP, "landscape_top"),
+            (CONFIG_LANDSCAPE_BOTTOM, "landscape_bottom")
+        ]
+        
+        # Готовые варианты берем из кэша, остальные рендерим
+        _, landscape_configs = _restore_cached_variants(img_path, logo_img, user_text, landscape_configs, output_dir)
+        if not landscape_configs:
+            return True
+        
+        # Все три выравнивания режутся из одного уменьшенного буфера
+        with _span(timings, 'decode'):
+            source = load_source_image(img_path, [config for config, _ in landscape_configs])
+        if source is None:
+            return False
+        with _span(timings, 'resize'):
+            source.prepare([config for config, _ in landscape_configs])
+        
+        # Создаем только варианты для инвестпортала
+        success_count = process_variants(source, logo_img, user_text, landscape_configs, img_path, output_dir,
+                                         timings=timings)
+        return success_count > 0
             
     except Exception as e:
         logger.error(f"Ошибка обработки изображения {img_path}: {e}")
         return False
 
-def process_single_image_investor_only_single(img_path: str, logo_img: Image.Image, user_text: str, landscape_config) -> bool:
+@_timed_job
+def process_single_image_investor_only_single(img_path: str, logo_img: Image.Image, user_text: str, landscape_config,
+                                              output_dir: Optional[str] = None,
+                                              timings: Optional[StageTimings] = None) -> bool:
     """Обработка одного изображения только для инвестпортала (создает один вариант с выбранной ориентацией)"""
     try:
-        with safe_open_image(img_path) as base:
-            if base is None:
-                return False
-            
-            # Определяем суффикс на основе выбранной ориентации
-            alignment = landscape_config.get('image_alignment', 'bottom')
-            suffix = f"landscape_{alignment}"
-            print(f"DEBUG: process_single_image_investor_only_single: alignment={alignment}, suffix={suffix}")
-            print(f"DEBUG: process_single_image_investor_only_single: landscape_config = {landscape_config}")
-            
-            # Создаем только один вариант для инвестпортала с выбранной ориентацией
-            success = process_image_with_config(base, logo_img, user_text, landscape_config, img_path, suffix)
-            return success
+        # Определяем суффикс на основе выбранной ориентации
+        alignment = landscape_config.get('image_alignment', 'bottom')
+        suffix = f"landscape_{alignment}"
+        logger.debug(f"process_single_image_investor_only_single: alignment={alignment}, suffix={suffix}")
+        logger.debug(f"process_single_image_investor_only_single: landscape_config = {landscape_config}")
+        
+        _, remaining = _restore_cached_variants(img_path, logo_img, user_text, [(landscape_config, suffix)],
+                                                output_dir)
+        if not remaining:
+            return True
+        
+        with _span(timings, 'decode'):
+            source = load_source_image(img_path, [landscape_config])
+        if source is None:
+            return False
+        
+        # Создаем только один вариант для инвестпортала с выбранной ориентацией
+        success = process_image_with_config(source, logo_img, user_text, landscape_config, img_path, suffix,
+                                            output_dir=output_dir, timings=timings)
+        return success
             
     except Exception as e:
         logger.error(f"Ошибка обработки изображения {img_path}: {e}")
         return False
 
-def process_single_image_all_orientations(img_path: str, logo_img: Image.Image, user_text: str) -> bool:
+@_timed_job
+def process_single_image_all_orientations(img_path: str, logo_img: Image.Image, user_text: str,
+                                          output_dir: Optional[str] = None,
+                                          timings: Optional[StageTimings] = None) -> bool:
     """Обработка одного изображения с созданием всех вариантов ориентации"""
     try:
-        with safe_open_image(img_path) as base:
-            if base is None:
-                return False
-            
-            # Создаем изображения
-            success_count = 0
-            
-            # Первое изображение (квадрат 2160x2160)
-            if process_image_with_config(base, logo_img, user_text, CONFIG, img_path, "square"):
-                success_count += 1
-            
-            # Три варианта ландшафтного изображения
-            landscape_configs = [
-                (CONFIG_LANDSCAPE_CENTER, "landscape_center"),
-                (CONFIG_LANDSCAPE_TOP, "landscape_top"),
-                (CONFIG_LANDSCAPE_BOTTOM, "landscape_bottom")
-            ]
-            
-            for config, suffix in landscape_configs:
-                if process_image_with_config(base, logo_img, user_text, config, img_path, suffix):
-                    success_count += 1
-            
-            return success_count > 0
+        # Три варианта ландшафтного изображения
+        landscape_configs = [
+            (CONFIG_LANDSCAPE_CENTER, "landscape_center"),
+            (CONFIG_LANDSCAPE_TOP, "landscape_top"),
+            (CONFIG_LANDSCAPE_BOTTOM, "landscape_bottom")
+        ]
+        # Готовые варианты берем из кэша, остальные рендерим
+        _, variants = _restore_cached_variants(img_path, logo_img, user_text,
+                                               [(CONFIG, "square")] + landscape_configs, output_dir)
+        if not variants:
+            return True
+        all_configs = [config for config, _ in variants]
+        
+        # Одно декодирование и одно масштабирование оригинала на все варианты
+        with _span(timings, 'decode'):
+            source = load_source_image(img_path, all_configs)
+        if source is None:
+            return False
+        with _span(timings, 'resize'):
+            source.prepare(all_configs)
+        
+        # Создаем изображения: квадрат 2160x2160 и три ландшафта
+        success_count = process_variants(source, logo_img, user_text, variants, img_path, output_dir, timings=timings)
+        return success_count > 0
             
     except Exception as e:
         logger.error(f"Ошибка обработки изображения {img_path}: {e}")
         return False
 
-def process_single_image(img_path: str, logo_img: Image.Image, user_text: str, landscape_config=None) -> bool:
+@_timed_job
+def process_single_image(img_path: str, logo_img: Image.Image, user_text: str, landscape_config=None,
+                         output_dir: Optional[str] = None,
+                         timings: Optional[StageTimings] = None) -> bool:
     """Обработка одного изображения с созданием двух версий (для обратной совместимости)"""
     try:
-        with safe_open_image(img_path) as base:
-            if base is None:
-                return False
-            
-            # Создаем два изображения
-            success_count = 0
-            
-            # Первое изображение (квадрат 2160x2160)
-            if process_image_with_config(base, logo_img, user_text, CONFIG, img_path, "square"):
-                success_count += 1
-            
-            # Второе изображение (ландшафт 2310x1200) с выбранной ориентацией
-            landscape_config = landscape_config or CONFIG_LANDSCAPE_BOTTOM
-            # Определяем суффикс на основе выбранной ориентации
-            alignment = landscape_config.get('image_alignment', 'bottom')
-            suffix = f"landscape_{alignment}"
-            print(f"DEBUG: process_single_image: alignment={alignment}, suffix={suffix}")
-            print(f"DEBUG: process_single_image: landscape_config = {landscape_config}")
-            if process_image_with_config(base, logo_img, user_text, landscape_config, img_path, suffix):
-                success_count += 1
-            
-            return success_count > 0
+        landscape_config = landscape_config or CONFIG_LANDSCAPE_BOTTOM
+        
+        # Второе изображение (ландшафт 2310x1200) с выбранной ориентацией
+        # Определяем суффикс на основе выбранной ориентации
+        alignment = landscape_config.get('image_alignment', 'bottom')
+        suffix = f"landscape_{alignment}"
+        logger.debug(f"process_single_image: alignment={alignment}, suffix={suffix}")
+        logger.debug(f"process_single_image: landscape_config = {landscape_config}")
+        
+        # Готовые варианты берем из кэша, остальные рендерим
+        _, variants = _restore_cached_variants(img_path, logo_img, user_text,
+                                               [(CONFIG, "square"), (landscape_config, suffix)], output_dir)
+        if not variants:
+            return True
+        configs = [config for config, _ in variants]
+        
+        # Одно декодирование и одно масштабирование оригинала на оба варианта
+        with _span(timings, 'decode'):
+            source = load_source_image(img_path, configs)
+        if source is None:
+            return False
+        with _span(timings, 'resize'):
+            source.prepare(configs)
+        
+        # Создаем два изображения: квадрат 2160x2160 и ландшафт
+        success_count = process_variants(source, logo_img, user_text, variants, img_path, output_dir, timings=timings)
+        return success_count > 0
             
     except Exception as e:
         logger.error(f"Ошибка обработки изображения {img_path}: {e}")
         return False
 
-def process_image_with_config(base: Image.Image, logo_img: Image.Image, user_text: str, 
-                            config: dict, img_path: str, suffix: str) -> bool:
-    """Обработка изображения с заданной конфигурацией"""
-    try:
-        # Копируем базовое изображение
-        img_copy = base.copy()
-        
-        # Определяем размеры
-        if isinstance(config['target_size'], tuple):
-            target_width, target_height = config['target_size']
-            is_landscape = True
-        else:
-            target_width = target_height = config['target_size']
-            is_landscape = False
-        
-        # Привести изображение к нужному размеру
-        orig_w, orig_h = img_copy.size
-        scale = max(target_width / orig_w, target_height / orig_h)
-        new_w = int(orig_w * scale)
-        new_h = int(orig_h * scale)
-        
-        # Выбор алгоритма сжатия
-        if Resampling:
-            resample = Resampling.LANCZOS
-        else:
-            resample = getattr(Image, 'LANCZOS', None)
-            if resample is None:
-                resample = getattr(Image, 'BICUBIC', 3)
-        
-        img_copy = img_copy.resize((new_w, new_h), resample)
-        
-        # Обрезка и выравнивание
-        if is_landscape:
-            # Для ландшафта выбираем выравнивание
-            left = (new_w - target_width) // 2
-            alignment = config.get('image_alignment', 'bottom')
-            logger.info(f"Выравнивание ландшафта: {alignment}")
-            if alignment == 'top':
-                top = 0  # Выравнивание по верху
-                logger.info("Применено выравнивание по верху")
-            elif alignment == 'center':
-                top = (new_h - target_height) // 2  # Выравнивание по центру
-                logger.info("Применено выравнивание по центру")
-            else:  # bottom
-                top = new_h - target_height  # Выравнивание по нижнему краю
-                logger.info("Применено выравнивание по низу")
-        else:
-            # Для квадрата центрируем
-            left = (new_w - target_width) // 2
-            top = (new_h - target_height) // 2
-        
-        img_copy = img_copy.crop((left, top, left + target_width, top + target_height))
+def render_background(base: Union[Image.Image, SourceImage], logo_img: Image.Image,
+                      config: Union[dict, RenderPlan], timings: Optional[StageTimings] = None,
+                      variant: Optional[str] = None) -> Image.Image:
+    """Кадр варианта с полосой градиента и сетки, но без текста, треугольника и логотипа
+    
+    Треугольник и логотип накладываются после текста (render_variant), поэтому
+    фон не зависит от заголовка и может переиспользоваться при его смене.
+    """
+    plan = get_render_plan(config)
+    
+    # Общие буферы масштабирования между вариантами одного фото
+    source = base if isinstance(base, SourceImage) else SourceImage(base)
+    with _span(timings, 'resize', variant):
+        img = source.crop(plan)
+    
+    # Статичная рамка: градиент и сетка
+    # (фото без прозрачности остается в RGB до самого кодирования)
+    with _span(timings, 'frame', variant):
+        frame = get_brand_frame(plan, logo_img)
+    with _span(timings, 'composite', variant):
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+        img = frame.composite(img)
+    return img
 
-        # Градиент по нижней части
-        grad_height = int(img_copy.height * config['gradient_height_ratio'])
-        grad = create_gradient_optimized(
-            img_copy.width, grad_height, 
-            config['gradient_colors']['bottom'], 
-            config['gradient_colors']['bottom_end'],
-            reverse=False
-        )
-        
-        # Размещаем градиент внизу
-        grad_y = img_copy.height - grad_height
-        temp_img = Image.new('RGBA', img_copy.size, (0, 0, 0, 0))
-        temp_img.paste(grad, (0, grad_y))
-        img_copy = Image.alpha_composite(img_copy, temp_img)
+def render_variant(base: Optional[Union[Image.Image, SourceImage]], logo_img: Image.Image, user_text: str,
+                   config: Union[dict, RenderPlan], timings: Optional[StageTimings] = None, variant: Optional[str] = None,
+                   background: Optional[Image.Image] = None) -> Image.Image:
+    """Рендеринг одного варианта в памяти (без сохранения на диск)
+    
+    Если передан timings, время этапов записывается в него под именем variant.
+    Готовый фон из render_background (background) копируется и не изменяется;
+    тогда base не нужен.
+    """
+    plan = get_render_plan(config)
+    if background is None:
+        img_copy = render_background(base, logo_img, plan, timings, variant)
+    else:
+        img_copy = background.copy()
 
-        # Сетка поверх градиента
-        grid_square_size = config['grid_square_size']
-        grid_overlay = Image.new('RGBA', img_copy.size, (0, 0, 0, 0))
-        grid_draw = ImageDraw.Draw(grid_overlay)
-        
-        # Создаем градиент прозрачности для сетки (белый цвет)
-        grid_gradient = create_gradient_optimized(
-            img_copy.width, grad_height,
-            (255, 255, 255),  # Белый цвет
-            (255, 255, 255),  # Белый цвет
-            reverse=False
-        )
-        
-        # Вычисляем начальную позицию для центрирования сетки
-        grid_start_x = (img_copy.width % grid_square_size) // 2
-        grid_start_y = grad_y + (grid_square_size - (img_copy.height - grad_y) % grid_square_size) // 2 + config['grid_vertical_offset']
-        
-        # Рисуем вертикальные линии сетки
-        for x in range(grid_start_x, img_copy.width, grid_square_size):
-            if x < img_copy.width:
-                for y in range(grad_y, img_copy.height):
-                    if y < img_copy.height:
-                        grad_pos = (y - grad_y) / grad_height
-                        if grad_pos <= 1.0:
-                            alpha = int(grid_gradient.getpixel((x, int(grad_pos * grad_height)))[3] * config['grid_opacity_ratio'])
-                            for offset in range(config['grid_line_thickness']):
-                                if x + offset < img_copy.width:
-                                    grid_draw.line([(x + offset, y), (x + offset, y)], fill=(255, 255, 255, alpha))
-        
-        # Рисуем горизонтальные линии сетки
-        for y in range(grid_start_y, img_copy.height, grid_square_size):
-            if y < img_copy.height:
-                grad_pos = (y - grad_y) / grad_height
-                if grad_pos <= 1.0:
-                    alpha = int(grid_gradient.getpixel((0, int(grad_pos * grad_height)))[3] * config['grid_opacity_ratio'])
-                    for offset in range(config['grid_line_thickness']):
-                        if y + offset < img_copy.height:
-                            grid_draw.line([(0, y + offset), (img_copy.width, y + offset)], fill=(255, 255, 255, alpha))
-        
-        # Накладываем сетку на изображение
-        img_copy = Image.alpha_composite(img_copy, grid_overlay)
-
-        # Текст пользователя
-        draw = ImageDraw.Draw(img_copy)
-        margin = config['margins']['text']
-        user_font = get_font(config['font_size'])
-        max_text_width = img_copy.width - 2 * margin
-        
-        lines = wrap_text(user_text, user_font, max_text_width, config['max_lines'])
-        bbox = user_font.getbbox('Ay')
-        line_height = bbox[3] - bbox[1]
-        line_spacing = int(line_height * config['line_spacing_ratio'])
-        total_text_height = len(lines) * line_height + (len(lines) - 1) * line_spacing
-        y = img_copy.height - total_text_height - margin
-        
-        for line in lines:
-            x = margin
-            draw.text((x, y), line, font=user_font, fill=(255, 255, 255, 255))
-            y += line_height + line_spacing
-
-        # Треугольник с градиентом
-        triangle_size = config['triangle_size']
-        tri_grad = create_gradient_optimized(
-            triangle_size, triangle_size,
-            config['gradient_colors']['triangle_start'],
-            config['gradient_colors']['triangle_end']
+    # Раскладка и растеризация текста пользователя (из кэша, если заголовок уже рисовался)
+    with _span(timings, 'text_layout', variant):
+        text_layer = get_text_layer(user_text, plan)
+        text_top = img_copy.height - text_layer.height - plan.text_margin
+
+    # Текст пользователя - одна заливка по маске
+    with _span(timings, 'text', variant):
+        text_layer.paste(img_copy, (plan.text_margin, text_top))
+    
+    # Треугольник и логотип поверх текста (длинный текст остается под ними, как и раньше)
+    with _span(timings, 'frame', variant):
+        frame = get_brand_frame(plan, logo_img)
+    with _span(timings, 'composite', variant):
+        img_copy = frame.composite_overlay(img_copy)
+    
+    return img_copy
+
+class BackgroundCache:
+    """Недавние фоны вариантов (render_background) по фото, конфигурации и логотипу
+    
+    Пока запись жива (BACKGROUND_CACHE_TTL), смена одного заголовка не требует
+    декодирования, масштабирования и наложения рамки - рисуется только текст.
+    Вытеснение по LRU сверх BACKGROUND_CACHE_SIZE записей.
+    """
+    
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        self.max_entries = BACKGROUND_CACHE_SIZE if max_entries is None else max_entries
+        self.ttl = BACKGROUND_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # ключ -> (время истечения, фон)
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(source_digest: str, config: Union[dict, RenderPlan], logo_img: Image.Image) -> tuple:
+        return source_digest, get_render_plan(config).config_key, _logo_fingerprint(logo_img)
+    
+    def get(self, key: tuple) -> Optional[Image.Image]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, key: tuple, background: Image.Image) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, background)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+BACKGROUND_CACHE = BackgroundCache()
+
+class EncoderStats:
+    """Накопленная статистика кодирования по профилям: время и размер"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = {}
+    
+    def record(self, profile: str, seconds: float, size: int) -> None:
+        with self._lock:
+            stats = self._profiles.setdefault(profile, {'count': 0, 'seconds': 0.0, 'bytes': 0})
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            stats['bytes'] += size
+    
+    def summary(self) -> dict:
+        """{профиль: {'count', 'seconds', 'bytes', 'avg_seconds', 'avg_bytes'}}"""
+        with self._lock:
+            return {
+                profile: dict(stats, avg_seconds=stats['seconds'] / stats['count'], avg_bytes=stats['bytes'] // stats['count'])
+                for profile, stats in self._profiles.items()
+            }
+
+ENCODER_STATS = EncoderStats()
+
+def get_encoder_profile(profile: Optional[str] = None) -> dict:
+    """Параметры профиля кодирования (по умолчанию - OUTPUT_PROFILE)"""
+    name = profile or OUTPUT_PROFILE
+    if name not in ENCODER_PROFILES:
+        raise ImageProcessorError(f"Неизвестный профиль кодирования: {name}")
+    return ENCODER_PROFILES[name]
+
+def encode_image(img: Image.Image, profile: Optional[str] = None) -> dict:
+    """Кодирование результата по профилю
+    
+    Возвращает {'data', 'format', 'extension', 'profile', 'seconds', 'bytes'}.
+    """
+    name = profile or OUTPUT_PROFILE
+    settings = get_encoder_profile(name)
+    
+    start_time = time.perf_counter()
+    buffer = io.BytesIO()
+    # RGB-кадр кодируется без лишней копии
+    (img if img.mode == 'RGB' else img.convert('RGB')).save(buffer, settings['format'], **settings['params'])
+    data = buffer.getvalue()
+    seconds = time.perf_counter() - start_time
+    
+    ENCODER_STATS.record(name, seconds, len(data))
+    logger.info(f"Кодирование {name}: {seconds:.2f} сек, {len(data) / 1024:.0f} КБ")
+    return {
+        'data': data,
+        'format': settings['format'],
+        'extension': settings['extension'],
+        'profile': name,
+        'seconds': seconds,
+        'bytes': len(data),
+    }
+
+class ResultCache:
+    """Кэш закодированных результатов на диске с адресацией по содержимому
+    
+    Ключ - хеш исходного фото, нормализованного текста, скомпилированной
+    конфигурации, версий логотипа и шрифта и профиля кодирования. Размер
+    ограничен бюджетом, вытесняются давно не использованные записи (время
+    использования хранится в mtime файла). Кэш общий для процессов пула:
+    суммарный размер ведется в файле учета под файловой блокировкой, поэтому
+    бюджет соблюдается для всех процессов вместе. Каталог целиком
+    просматривается, только когда сумма превысила бюджет (или учета еще нет).
+    """
+    
+    def __init__(self, cache_dir: str = None, max_bytes: int = None):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_bytes = RESULT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        self._index = None  # OrderedDict {ключ: (путь, размер)}, от старых к новым
+        self._total_bytes = 0
+        self._digests = OrderedDict()  # (путь, mtime, размер) -> хеш содержимого фото
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+    
+    def _load_index(self) -> None:
+        """Индекс по файлам каталога, от давно использованных к недавним"""
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, '*', '*')):
+            # Недописанные файлы других процессов (и оставшиеся после сбоя)
+            if path.endswith('.tmp'):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            key = os.path.splitext(os.path.basename(path))[0]
+            entries.append((stat.st_mtime_ns, key, path, stat.st_size))
+        self._index = OrderedDict((key, (path, size)) for _, key, path, size in sorted(entries))
+        self._total_bytes = sum(size for _, size in self._index.values())
+    
+    def source_digest(self, source: Union[str, bytes]) -> str:
+        """Хеш содержимого фото; для файлов запоминается по пути, mtime и размеру"""
+        if isinstance(source, bytes):
+            return hashlib.sha256(source).hexdigest()
+        stat = os.stat(source)
+        memo_key = (os.path.abspath(source), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(memo_key)
+            if digest is not None:
+                self._digests.move_to_end(memo_key)
+                return digest
+        with open(source, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with self._lock:
+            self._digests[memo_key] = digest
+            while len(self._digests) > RESULT_CACHE_DIGESTS_SIZE:
+                self._digests.popitem(last=False)
+        return digest
+    
+    def make_key(self, source_digest: str, user_text: str, config: Union[dict, RenderPlan],
+                 logo_img: Image.Image, profile: Optional[str] = None) -> str:
+        """Ключ результата одного варианта"""
+        font_path = os.path.join(FONTS_DIR, DEFAULT_FONT)
+        try:
+            stat = os.stat(font_path)
+            font_version = (DEFAULT_FONT, stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            font_version = None
+        profile_name = profile or OUTPUT_PROFILE
+        parts = (
+            RESULT_CACHE_VERSION,
+            source_digest,
+            # Перенос строк идет по словам, поэтому пробелы не влияют на результат
+            ' '.join(user_text.split()),
+            get_render_plan(config).config_key,
+            _logo_fingerprint(logo_img),
+            font_version,
+            profile_name,
+            _freeze(get_encoder_profile(profile_name)),
         )
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """(данные, расширение) или None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            entry = self._index.get(key)
+            if entry is not None:
+                path, size = entry
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    os.utime(path)
+                except OSError:
+                    # Файл удалил другой процесс
+                    self._index.pop(key)
+                    self._total_bytes -= size
+                    entry = None
+                else:
+                    self._index.move_to_end(key)
+                    self.hits += 1
+                    return data, os.path.splitext(path)[1]
+            self.misses += 1
+            return None
+    
+    def put(self, key: str, data: bytes, extension: str) -> None:
+        """Сохраняет результат и вытесняет старые записи сверх бюджета"""
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        path = os.path.join(self.cache_dir, key[:2], key + extension)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        except OSError as e:
+            logger.warning(f"Не удалось записать результат в кэш: {e}")
+            return
         
-        # Создаем маску треугольника
-        tri_mask = Image.new('L', (triangle_size, triangle_size), 0)
-        tri_mask_draw = ImageDraw.Draw(tri_mask)
-        tri_mask_draw.polygon([
-            (triangle_size, 0), 
-            (triangle_size, triangle_size), 
-            (0, 0)
-        ], fill=255)
-        
-        tri_grad.putalpha(tri_mask)
-        img_copy.alpha_composite(tri_grad, (img_copy.width - triangle_size, 0))
-
-        # Логотип
-        logo_w, logo_h = logo_img.size
-        logo_x = img_copy.width - logo_w - config['margins']['logo']
-        logo_y = config['margins']['logo']
-        
-        # Для ландшафтного изображения изменяем размер логотипа
-        if 'logo_size' in config and config['logo_size']:
-            target_logo_w, target_logo_h = config['logo_size']
-            logo_img_resized = logo_img.resize((target_logo_w, target_logo_h), Image.Resampling.LANCZOS if hasattr(Image, 'Resampling') else Image.LANCZOS)
-            logo_w, logo_h = logo_img_resized.size
-            logo_x = img_copy.width - logo_w - config['margins']['logo']
-            img_copy.alpha_composite(logo_img_resized, (logo_x, logo_y))
-        else:
-            img_copy.alpha_composite(logo_img, (logo_x, logo_y))
+        with self._lock, self._disk_lock():
+            if self._index is None:
+                self._load_index()
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            try:
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Не удалось записать результат в кэш: {e}")
+                return
+            self._index.pop(key, None)
+            self._index[key] = (path, len(data))
+            
+            total = self._read_ledger()
+            if total is None:
+                # Учета нет (первый запуск или сбой при записи) - считаем по диску
+                self._load_index()
+                total = self._total_bytes
+            else:
+                total += len(data) - old_size
+            if total > self.max_bytes:
+                # Другие процессы тоже пишут в каталог: вытесняем по диску
+                self._load_index()
+                total = self._total_bytes
+                while total > self.max_bytes * RESULT_CACHE_EVICT_RATIO and self._index:
+                    old_key, (old_path, old_size) = self._index.popitem(last=False)
+                    total -= old_size
+                    self.evictions += 1
+                    try:
+                        os.remove(old_path)
+                    except OSError:
+                        pass
+            self._total_bytes = total
+            self._write_ledger(total)
+    
+    def _read_ledger(self) -> Optional[int]:
+        """Суммарный размер кэша из файла учета или None"""
+        try:
+            with open(os.path.join(self.cache_dir, '.size')) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+    
+    def _write_ledger(self, total: int) -> None:
+        try:
+            with open(os.path.join(self.cache_dir, '.size'), 'w') as f:
+                f.write(str(total))
+        except OSError as e:
+            logger.warning(f"Не удалось обновить учет размера кэша: {e}")
+    
+    @contextlib.contextmanager
+    def _disk_lock(self):
+        """Межпроцессная блокировка на время учета размера и вытеснения"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.cache_dir, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._index) if self._index is not None else None,
+                'bytes': self._total_bytes,
+            }
+
+RESULT_CACHE = ResultCache()
+
+def _restore_cached_variants(img_path: str, logo_img: Image.Image, user_text: str,
+                             variants: List[Tuple[dict, str]],
+                             output_dir: Optional[str] = None) -> Tuple[int, List[Tuple[dict, str]]]:
+    """Копирует готовые результаты из кэша в output_dir (по умолчанию OUTPUT_DIR)
+    
+    Возвращает число восстановленных вариантов и варианты, которые нужно отрисовать.
+    """
+    base_name = os.path.splitext(os.path.basename(img_path))[0]
+    restored, remaining = 0, []
+    for config, suffix in variants:
+        cache_key = _result_cache_key(img_path, logo_img, user_text, config)
+        cached = RESULT_CACHE.get(cache_key) if cache_key else None
+        if cached is None:
+            remaining.append((config, suffix))
+            continue
+        data, extension = cached
+        out_path = os.path.join(output_dir or OUTPUT_DIR, f"{base_name}_{suffix}{extension}")
+        with open(out_path, 'wb') as f:
+            f.write(data)
+        logger.info(f"Сохранено из кэша: {out_path}")
+        restored += 1
+    return restored, remaining
+
+def _result_cache_key(source: Union[str, bytes], logo_img: Image.Image, user_text: str,
+                      config: Union[dict, RenderPlan], profile: Optional[str] = None) -> Optional[str]:
+    """Ключ кэша результатов или None, если кэш выключен или фото недоступно"""
+    if not RESULT_CACHE.enabled:
+        return None
+    try:
+        return RESULT_CACHE.make_key(RESULT_CACHE.source_digest(source), user_text, config, logo_img, profile)
+    except OSError:
+        return None
+
+_encode_executor = None
+_encode_executor_lock = threading.Lock()
+
+def _get_encode_executor() -> ThreadPoolExecutor:
+    """Общий пул потоков для кодирования и сохранения вариантов
+    
+    Кодеры zlib/JPEG/WebP в Pillow отпускают GIL, поэтому кодирование одного
+    варианта идет параллельно с композицией следующего. Пул создается лениво,
+    так что у каждого процесса пакетной обработки он свой.
+    """
+    global _encode_executor
+    with _encode_executor_lock:
+        if _encode_executor is None:
+            _encode_executor = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix='encode')
+        return _encode_executor
+
+def _encode_and_save(img: Image.Image, out_path_base: Optional[str], profile: Optional[str] = None,
+                     timings: Optional[StageTimings] = None, variant: Optional[str] = None,
+                     cache_key: Optional[str] = None) -> dict:
+    """Кодирование варианта и сохранение, если задан путь (без расширения)
+    
+    С cache_key результат дополнительно кладется в RESULT_CACHE.
+    """
+    with _span(timings, 'encode', variant):
+        encoded = encode_image(img, profile)
+    if cache_key:
+        RESULT_CACHE.put(cache_key, encoded['data'], encoded['extension'])
+    encoded['path'] = None
+    if out_path_base:
+        encoded['path'] = out_path_base + encoded['extension']
+        with _span(timings, 'save', variant):
+            with open(encoded['path'], 'wb') as f:
+                f.write(encoded['data'])
+        logger.info(f"Сохранено: {encoded['path']}")
+    return encoded
+
+@_timed_job
+def process_image_with_config(base: Union[Image.Image, SourceImage], logo_img: Image.Image, user_text: str, 
+                            config: dict, img_path: str, suffix: str, alignment: Optional[str] = None,
+                            output_dir: Optional[str] = None, timings: Optional[StageTimings] = None) -> bool:
+    """Обработка изображения с заданной конфигурацией и сохранением в output_dir (по умолчанию OUTPUT_DIR)
+    
+    alignment переопределяет выравнивание ландшафта из конфигурации
+    ('top', 'center', 'bottom' или 'auto' - по карте значимости).
+    """
+    try:
+        if alignment:
+            config = dict(config, image_alignment=alignment)
+        img_copy = render_variant(base, logo_img, user_text, config, timings, suffix)
 
         # Сохранение результата
         base_name = os.path.splitext(os.path.basename(img_path))[0]
-        out_path = os.path.join(OUTPUT_DIR, f"{base_name}_{suffix}.png")
-        img_copy.convert('RGB').save(out_path, quality=95, optimize=True)
-        logger.info(f'Сохранено: {out_path}')
+        _encode_and_save(img_copy, os.path.join(output_dir or OUTPUT_DIR, f"{base_name}_{suffix}"), None, timings, suffix,
+                         _result_cache_key(img_path, logo_img, user_text, config))
         return True
         
     except Exception as e:
         logger.error(f"Ошибка обработки изображения с конфигурацией {suffix}: {e}")
         return False
 
+def process_variants(source: SourceImage, logo_img: Image.Image, user_text: str,
+                     variants: List[Tuple[dict, str]], img_path: str, output_dir: Optional[str] = None,
+                     timings: Optional[StageTimings] = None) -> int:
+    """Обработка нескольких вариантов одного фото с сохранением в output_dir (по умолчанию OUTPUT_DIR)
+    
+    Композиция идет в текущем потоке, кодирование и запись - в пуле потоков,
+    параллельно с композицией следующего варианта. Возвращает число
+    сохраненных вариантов; ошибки пишутся в лог по каждому варианту.
+    """
+    base_name = os.path.splitext(os.path.basename(img_path))[0]
+    output_dir = output_dir or OUTPUT_DIR
+    executor = _get_encode_executor()
+    pending = []
+    
+    for config, suffix in variants:
+        try:
+            img_copy = render_variant(source, logo_img, user_text, config, timings, suffix)
+        except Exception as e:
+            logger.error(f"Ошибка обработки изображения с конфигурацией {suffix}: {e}")
+            continue
+        out_path_base = os.path.join(output_dir, f"{base_name}_{suffix}")
+        cache_key = _result_cache_key(img_path, logo_img, user_text, config)
+        pending.append((suffix, executor.submit(_encode_and_save, img_copy, out_path_base, None, timings, suffix,
+                                                cache_key)))
+    
+    # Результаты собираем в исходном порядке
+    success_count = 0
+    for suffix, future in pending:
+        try:
+            future.result()
+            success_count += 1
+        except Exception as e:
+            logger.error(f"Ошибка обработки изображения с конфигурацией {suffix}: {e}")
+    return success_count
+
+@_timed_job
+def render(image: Union[str, bytes, Image.Image, SourceImage], user_text: str,
+           variants: Optional[List[str]] = None, logo_img: Optional[Image.Image] = None,
+           output_dir: Optional[str] = None, base_name: str = 'image',
+           profile: Union[str, Dict[str, str], None] = None,
+           timings: Optional[StageTimings] = None) -> dict:
+    """Рендеринг в памяти: фото (байты, путь или PIL) + текст -> закодированные варианты
+    
+    Возвращает словарь {имя варианта: {'data', 'format', 'size', 'filename', 'path',
+    'seconds', 'profile', 'encode_seconds', 'bytes', 'stages', 'cached'}}. Варианты, которые не удалось
+    отрисовать, в результат не попадают (ошибка пишется в лог). Если задан
+    output_dir, файлы дополнительно сохраняются туда. profile - имя профиля
+    кодирования для всех вариантов или словарь {вариант: профиль}.
+    stages - время этапов варианта (пусто при выключенном STAGE_TIMING); общие
+    этапы (декодирование, масштабирование) есть только в переданном timings.
+    Для фото в байтах или по пути результаты берутся из RESULT_CACHE (cached=True),
+    а фоны без текста - из BACKGROUND_CACHE: при смене одного заголовка фото не
+    декодируется заново, рисуется только текст.
+    """
+    variants = list(variants or DEFAULT_VARIANTS)
+    unknown = [name for name in variants if name not in VARIANTS]
+    if unknown:
+        raise ImageProcessorError(f"Неизвестные варианты: {', '.join(unknown)}")
+    order = variants
+    configs = [RENDER_PLANS[name] for name in variants]
+    profiles = {name: profile.get(name) if isinstance(profile, dict) else profile for name in variants}
+    for name in variants:
+        get_encoder_profile(profiles[name])
+    
+    user_text = validate_text(user_text)
+    if logo_img is None:
+        logo_img = LOGO_ASSETS.logo()
+        if logo_img is None:
+            raise ImageProcessorError('Логотип не найден в папке logo!')
+    
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    # Хеш фото - для кэша результатов и кэша фонов (только для байтов или пути)
+    digest = None
+    if isinstance(image, (str, bytes)):
+        try:
+            digest = RESULT_CACHE.source_digest(image)
+        except OSError:
+            digest = None
+    
+    # Готовые варианты из кэша результатов
+    results = {}
+    cache_keys = {}
+    if digest is not None:
+        for name, config in zip(variants, configs):
+            start_time = time.time()
+            cache_key = None
+            if RESULT_CACHE.enabled:
+                cache_key = RESULT_CACHE.make_key(digest, user_text, config, logo_img, profiles[name])
+            cached = RESULT_CACHE.get(cache_key) if cache_key else None
+            if cached is None:
+                cache_keys[name] = cache_key
+                continue
+            data, extension = cached
+            path = None
+            if output_dir:
+                path = os.path.join(output_dir, f"{base_name}_{name}{extension}")
+                with open(path, 'wb') as f:
+                    f.write(data)
+            profile_name = profiles[name] or OUTPUT_PROFILE
+            results[name] = {
+                'data': data,
+                'format': get_encoder_profile(profile_name)['format'],
+                'size': config.size,
+                'filename': f"{base_name}_{name}{extension}",
+                'path': path,
+                'seconds': time.time() - start_time,
+                'profile': profile_name,
+                'encode_seconds': 0.0,
+                'bytes': len(data),
+                'stages': {},
+                'cached': True,
+            }
+        if not cache_keys:
+            return results
+        variants = [name for name in variants if name in cache_keys]
+        configs = [RENDER_PLANS[name] for name in variants]
+    
+    # Фоны без текста, оставшиеся от недавнего рендеринга этого же фото
+    backgrounds = {}
+    background_keys = {}
+    if digest is not None:
+        for name, config in zip(variants, configs):
+            background_keys[name] = BackgroundCache.make_key(digest, config, logo_img)
+            background = BACKGROUND_CACHE.get(background_keys[name])
+            if background is not None:
+                backgrounds[name] = background
+    
+    # Одно декодирование и общие буферы масштабирования на все варианты
+    # (не нужно, если фоны всех вариантов уже есть)
+    missing = [config for name, config in zip(variants, configs) if name not in backgrounds]
+    source = None
+    if isinstance(image, SourceImage):
+        source = image
+    elif isinstance(image, Image.Image):
+        with _span(timings, 'decode'):
+            # Открытое, но еще не декодированное изображение
+            image.load()
+            source = SourceImage(image)
+    elif missing:
+        with _span(timings, 'decode'):
+            source = load_source_image(image, missing)
+        if source is None:
+            raise ImageProcessorError('Не удалось открыть изображение!')
+    if source is not None and missing:
+        with _span(timings, 'resize'):
+            source.prepare(missing)
+    
+    # Композиция в текущем потоке, кодирование и запись - в пуле потоков
+    executor = _get_encode_executor()
+    pending = []
+    for name, config in zip(variants, configs):
+        start_time = time.time()
+        try:
+            background = backgrounds.get(name)
+            if background is None and name in background_keys:
+                background = render_background(source, logo_img, config, timings, name)
+                BACKGROUND_CACHE.put(background_keys[name], background)
+            img = render_variant(source, logo_img, user_text, config, timings, name, background=background)
+        except Exception as e:
+            logger.error(f"Ошибка обработки изображения с конфигурацией {name}: {e}")
+            continue
+        out_path_base = os.path.join(output_dir, f"{base_name}_{name}") if output_dir else None
+        pending.append((name, config, start_time,
+                        executor.submit(_encode_and_save, img, out_path_base, profiles[name], timings, name,
+                                        cache_keys.get(name))))
+    
+    for name, config, start_time, future in pending:
+        try:
+            encoded = future.result()
+        except Exception as e:
+            logger.error(f"Ошибка обработки изображения с конфигурацией {name}: {e}")
+            continue
+        
+        results[name] = {
+            'data': encoded['data'],
+            'format': encoded['format'],
+            'size': config.size,
+            'filename': f"{base_name}_{name}{encoded['extension']}",
+            'path': encoded['path'],
+            'seconds': time.time() - start_time,
+            'profile': encoded['profile'],
+            'encode_seconds': encoded['seconds'],
+            'bytes': encoded['bytes'],
+            'stages': dict(timings.variants.get(name, {})) if timings is not None else {},
+            'cached': False,
+        }
+    # Порядок результатов - как в запросе
+    return {name: results[name] for name in order if name in results}
+
+def render_previews(image: Union[str, bytes, Image.Image, SourceImage], user_text: str,
+                    variants: Optional[List[str]] = None, logo_img: Optional[Image.Image] = None,
+                    scale: float = PREVIEW_SCALE) -> dict:
+    """Быстрые превью вариантов на реальном фото и заголовке (по умолчанию - 1/4 разрешения)
+    
+    Все размеры конфигураций (кадр, шрифт, сетка, отступы, логотип) уменьшаются
+    в scale раз, JPEG декодируется сразу в уменьшенном масштабе. Возвращает
+    {имя варианта: {'data', 'format', 'size', 'filename', 'seconds'}}.
+    """
+    variants = list(variants or PREVIEW_VARIANTS)
+    unknown = [name for name in variants if name not in VARIANTS]
+    if unknown:
+        raise ImageProcessorError(f"Неизвестные варианты: {', '.join(unknown)}")
+    
+    user_text = validate_text(user_text)
+    if logo_img is None:
+        logo_img = LOGO_ASSETS.logo()
+        if logo_img is None:
+            raise ImageProcessorError('Логотип не найден в папке logo!')
+    plans = [get_render_plan(scale_config(VARIANTS[name], scale, logo_img.size)) for name in variants]
+    
+    if isinstance(image, SourceImage):
+        source = image
+    elif isinstance(image, Image.Image):
+        source = SourceImage(image)
+    else:
+        source = load_source_image(image, plans)
+        if source is None:
+            raise ImageProcessorError('Не удалось открыть изображение!')
+    source.prepare(plans)
+    
+    results = {}
+    for name, plan in zip(variants, plans):
+        start_time = time.time()
+        try:
+            encoded = encode_image(render_variant(source, logo_img, user_text, plan), PREVIEW_PROFILE)
+        except Exception as e:
+            logger.error(f"Ошибка создания превью {name}: {e}")
+            continue
+        results[name] = {
+            'data': encoded['data'],
+            'format': encoded['format'],
+            'size': plan.size,
+            'filename': f"preview_{name}{encoded['extension']}",
+            'seconds': time.time() - start_time,
+        }
+    return results
+
+def new_job_id(prefix: Optional[str] = None) -> str:
+    """Уникальный идентификатор задачи: время запуска и случайный суффикс"""
+    job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:12]}"
+    return f"{prefix}-{job_id}" if prefix else job_id
+
+def cleanup_jobs(max_age: Optional[float] = None, jobs_dir: Optional[str] = None) -> int:
+    """Удаляет папки задач старше max_age секунд (остатки после сбоев); возвращает их число"""
+    jobs_dir = jobs_dir or JOBS_DIR
+    max_age = JOB_TTL if max_age is None else max_age
+    removed = 0
+    for path in glob.glob(os.path.join(jobs_dir, '*')):
+        try:
+            if time.time() - os.stat(path).st_mtime < max_age:
+                continue
+            shutil.rmtree(path)
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Не удалось удалить папку задачи {path}: {e}")
+    if removed:
+        logger.info(f"Удалено устаревших папок задач: {removed}")
+    return removed
+
+class RenderJob:
+    """Задача рендеринга с собственным пространством имен результатов
+    
+    Файлы задачи пишутся только в её папку JOBS_DIR/<job_id>, поэтому
+    параллельные задачи не перезаписывают результаты друг друга, даже с
+    одинаковыми именами файлов. При save=False результаты остаются только в
+    памяти. Папка удаляется при выходе из with (или cleanup()), если не
+    указано keep=True; брошенные папки убирает cleanup_jobs().
+    
+        with RenderJob(prefix='user42', save=False) as job:
+            results = job.render(data, text, ['square'])
+    """
+    
+    def __init__(self, prefix: Optional[str] = None, save: bool = True, keep: bool = False,
+                 jobs_dir: Optional[str] = None):
+        self.job_id = new_job_id(prefix)
+        self.save = save
+        self.keep = keep
+        self.output_dir = os.path.join(jobs_dir or JOBS_DIR, self.job_id) if save else None
+    
+    def render(self, image: Union[str, bytes, Image.Image, SourceImage], user_text: str,
+               variants: Optional[List[str]] = None, **kwargs) -> dict:
+        """render() в пространстве задачи; каждый результат получает 'job_id'"""
+        start_time = time.time()
+        results = render(image, user_text, variants, output_dir=self.output_dir, **kwargs)
+        for result in results.values():
+            result['job_id'] = self.job_id
+        logger.info(f"Задача {self.job_id}: {len(results)} вариантов за {time.time() - start_time:.2f} сек")
+        return results
+    
+    def cleanup(self) -> None:
+        """Удаляет папку задачи"""
+        if self.output_dir and os.path.isdir(self.output_dir):
+            shutil.rmtree(self.output_dir, ignore_errors=True)
+    
+    def __enter__(self) -> 'RenderJob':
+        return self
+    
+    def __exit__(self, *exc_info):
+        if not self.keep:
+            self.cleanup()
+        return False
+
+# Логотип воркера пакетной обработки (загружается один раз на процесс)
+_worker_logo = None
+
+def _init_batch_worker(logo_path: str) -> None:
+    """Инициализация процесса пула: логотип, шрифты и рамки грузятся один раз"""
+    global _worker_logo
+    _worker_logo = safe_open_image(logo_path)
+    if _worker_logo is None:
+        raise ImageProcessorError('Не удалось загрузить логотип!')
+    FONT_REGISTRY.preload()
+    preload_brand_frames(_worker_logo)
+
+def _process_batch_item(img_path: str, user_text: str, output_dir: str) -> dict:
+    """Обработка одного фото в воркере пула; возвращает статус, время, разбивку по этапам
+    и попадания/промахи кэша результатов"""
+    start_time = time.time()
+    timings = StageTimings() if STAGE_TIMING else None
+    hits, misses = RESULT_CACHE.hits, RESULT_CACHE.misses
+    try:
+        success = process_single_image(img_path, _worker_logo, user_text, output_dir=output_dir, timings=timings)
+        error = None if success else 'не удалось обработать'
+    except Exception as e:
+        success, error = False, str(e)
+    result = {
+        'path': img_path,
+        'success': success,
+        'error': error,
+        'seconds': time.time() - start_time,
+        'stages': timings.as_dict()['stages'] if timings is not None else {},
+        'cache_hits': RESULT_CACHE.hits - hits,
+        'cache_misses': RESULT_CACHE.misses - misses,
+    }
+    if timings is not None and timings.peak_memory_mb is not None:
+        result['peak_memory_mb'] = timings.peak_memory_mb
+    return result
+
+def process_batch(image_files: List[str], logo_path: str, user_text: str,
+                  workers: Optional[int] = None, output_dir: Optional[str] = None) -> List[dict]:
+    """Пакетная обработка фото на пуле процессов с сохранением в output_dir (по умолчанию OUTPUT_DIR)
+    
+    Возвращает статусы в порядке завершения; при workers=1 работает без пула.
+    """
+    output_dir = output_dir or OUTPUT_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    workers = min(workers or BATCH_WORKERS or os.cpu_count() or 1, len(image_files)) or 1
+    logger.info(f"Пакетная обработка: {len(image_files)} изображений, процессов: {workers}")
+    start_time = time.time()
+    results = []
+    
+    def report(result: dict) -> None:
+        results.append(result)
+        status = '✅' if result['success'] else f"❌ {result['error']}"
+        logger.info(f"[{len(results)}/{len(image_files)}] {result['path']}: {status} ({result['seconds']:.2f} сек)")
+    
+    if workers == 1:
+        _init_batch_worker(logo_path)
+        for img_path in image_files:
+            report(_process_batch_item(img_path, user_text, output_dir))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(logo_path,)) as executor:
+            futures = [executor.submit(_process_batch_item, img_path, user_text, output_dir)
+                       for img_path in image_files]
+            for future in as_completed(futures):
+                result = future.result()
+                # Гистограммы воркеров живут в их процессах - сводим разбивки сюда
+                STAGE_HISTOGRAMS.record(result['stages'])
+                report(result)
+    
+    total_time = time.time() - start_time
+    if total_time > 0:
+        logger.info(f"Пропускная способность: {len(image_files) / total_time:.2f} изображений/сек")
+    if RESULT_CACHE.enabled:
+        cache_hits = sum(result['cache_hits'] for result in results)
+        cache_misses = sum(result['cache_misses'] for result in results)
+        logger.info(f"Кэш результатов: попаданий {cache_hits}, промахов {cache_misses}")
+    peaks = [result['peak_memory_mb'] for result in results if 'peak_memory_mb' in result]
+    if peaks:
+        logger.info(f"Пиковая память на фото: макс {max(peaks):.0f} МБ, среднее {sum(peaks) / len(peaks):.0f} МБ")
+    STAGE_HISTOGRAMS.log_summary()
+    return results
+
 def main():
     """Основная функция программы"""
     try:
@@ -607,11 +2588,9 @@ def main():
         logo_files = glob.glob(os.path.join(LOGO_DIR, '*'))
         if not logo_files:
             raise ImageProcessorError('Логотип не найден в папке logo!')
-        
-        logo_img = safe_open_image(logo_files[0])
-        if logo_img is None:
+        if safe_open_image(logo_files[0]) is None:
             raise ImageProcessorError('Не удалось загрузить логотип!')
-
+        
         # Обработка всех фото
         image_files = glob.glob(os.path.join(IMG_DIR, '*'))
         if not image_files:
@@ -619,14 +2598,14 @@ def main():
 
         logger.info(f"Найдено изображений для обработки: {len(image_files)}")
         
-        successful = 0
-        failed = 0
+        # Каждый запуск пишет в свою папку OUTPUT_DIR/<job_id>: одноименные фото
+        # разных запусков не перезаписывают друг друга
+        job = RenderJob(keep=True, jobs_dir=OUTPUT_DIR)
         
-        for img_path in image_files:
-            if process_single_image(img_path, logo_img, user_text):
-                successful += 1
-            else:
-                failed += 1
+        # Фото распределяются по процессам; логотип и рамки грузит каждый воркер
+        results = process_batch(image_files, logo_files[0], user_text, output_dir=job.output_dir)
+        successful = sum(1 for result in results if result['success'])
+        failed = len(results) - successful
 
         # Статистика
         total_time = time.time() - start_time
@@ -637,7 +2616,11 @@ def main():
             print(f"\n✅ Обработка завершена успешно!")
             print(f"📊 Обработано изображений: {successful}")
             print(f"⏱️  Время выполнения: {total_time:.2f} сек")
-            print(f"📁 Результаты сохранены в папку: {OUTPUT_DIR}")
+            print(f"🚀 Скорость: {len(results) / total_time:.2f} изображений/сек")
+            print(f"📁 Результаты сохранены в папку: {job.output_dir}")
+            if RESULT_CACHE.enabled:
+                cache_hits = sum(result['cache_hits'] for result in results)
+                print(f"♻️  Из кэша: {cache_hits} из {cache_hits + sum(result['cache_misses'] for result in results)} вариантов")
         else:
             print("❌ Не удалось обработать ни одного изображения")
 
@@ -1,24 +1,35 @@
 import telebot
 import os
-import glob
-from PIL import Image
 import main
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
 import requests
 import json
-import tempfile
-import uuid
 import config
 from deep_translator import GoogleTranslator
 import re
+import time
+import threading
+from collections import OrderedDict
 
 bot = telebot.TeleBot(config.TELEGRAM_BOT_TOKEN)
 
+# Профиль кодирования результатов (png, png_small, jpeg, webp, webp_lossless)
+OUTPUT_PROFILE = getattr(config, 'OUTPUT_PROFILE', None) or main.OUTPUT_PROFILE
+
+# Последние фото пользователей для смены заголовка: не больше записей и байт в сумме
+LAST_RENDER_MAX_ENTRIES = 64
+LAST_RENDER_MAX_BYTES = 256 * 1024 * 1024
+
+# Период записи в лог гистограмм этапов рендеринга и статистики кэша, сек (0 - не писать)
+STATS_LOG_INTERVAL = getattr(config, 'STATS_LOG_INTERVAL', 600)
+
 user_headers = {}
 user_landscape_orientation = {}  # Хранение выбора ориентации для каждого пользователя
 user_search_query = {}  # Хранение поискового запроса пользователя
-user_found_images = {}  # Хранение найденных изображений для каждого пользователя
+user_found_images = {}  # Хранение найденных (или уже загруженных для превью) изображений пользователя
 user_state = {}  # Состояние пользователя в диалоге
+user_last_render = OrderedDict()  # Последнее обработанное фото пользователя (для смены только заголовка)
+user_last_render_lock = threading.Lock()
 
 def translate_to_english(text):
     """Переводит текст на английский язык для лучшего поиска"""
@@ -109,9 +120,50 @@ def download_image(url, timeout=10):
         print(f"Ошибка скачивания изображения {url}: {e}")
         return None
 
-def create_image_choice_keyboard():
-    """Создает клавиатуру выбора: есть изображение или нужно найти"""
+def get_last_render(user_id):
+    """Последнее фото пользователя, если оно обработано недавно (пока жив фон в кэше рендерера)"""
+    with user_last_render_lock:
+        last = user_last_render.get(user_id)
+        if last and time.time() - last['time'] < main.BACKGROUND_CACHE_TTL:
+            return last
+        user_last_render.pop(user_id, None)
+        return None
+
+def remember_last_render(user_id, data, orientation):
+    """Запоминает фото пользователя; устаревшие и лишние записи всех пользователей удаляются"""
+    now = time.time()
+    with user_last_render_lock:
+        user_last_render.pop(user_id, None)
+        user_last_render[user_id] = {'data': data, 'orientation': orientation, 'time': now}
+        # Записи идут от старых к новым: сначала истекшие, затем сверх лимитов
+        total_bytes = sum(len(last['data']) for last in user_last_render.values())
+        while user_last_render:
+            oldest = next(iter(user_last_render.values()))
+            if (now - oldest['time'] < main.BACKGROUND_CACHE_TTL
+                    and len(user_last_render) <= LAST_RENDER_MAX_ENTRIES
+                    and total_bytes <= LAST_RENDER_MAX_BYTES):
+                break
+            total_bytes -= len(oldest['data'])
+            user_last_render.popitem(last=False)
+
+def log_stats_periodically(interval):
+    """Фоновая запись в лог времени этапов рендеринга (среднее, p95, макс) и кэша"""
+    while True:
+        time.sleep(interval)
+        main.STAGE_HISTOGRAMS.log_summary()
+        main.logger.info(f"Кэш результатов: {main.RESULT_CACHE.stats()}")
+
+def create_image_choice_keyboard(user_id=None):
+    """Создает клавиатуру выбора: есть изображение или нужно найти
+    
+    Если пользователь недавно получил результат, добавляется кнопка
+    повторной обработки того же фото с новым заголовком.
+    """
     keyboard = InlineKeyboardMarkup()
+    if user_id is not None and get_last_render(user_id):
+        keyboard.row(
+            InlineKeyboardButton("♻️ То же фото с новым заголовком", callback_data="reuse_image")
+        )
     keyboard.row(
         InlineKeyboardButton("🖼 У меня есть изображение", callback_data="have_image")
     )
@@ -129,8 +181,70 @@ def create_image_approval_keyboard():
     )
     return keyboard
 
+def send_orientation_previews(chat_id, user_id, mode_text):
+    """Отправляет превью всех вариантов для инвестпортала на фото пользователя с выбором ориентации"""
+    orientation_names = {
+        'auto': 'автоматически',
+        'center': 'по центру',
+        'top': 'по верху', 
+        'bottom': 'по низу'
+    }
+    try:
+        previews = main.render_previews(user_found_images[user_id]['data'], user_headers[user_id],
+                                        logo_img=main.LOGO_ASSETS.logo())
+        if not previews:
+            return False
+        
+        media = [
+            InputMediaPhoto(preview['data'], caption=f"💼 {orientation_names[name.split('_')[1]].capitalize()}")
+            for name, preview in previews.items()
+        ]
+        bot.send_media_group(chat_id, media)
+        bot.send_message(
+            chat_id,
+            f"✅ Выбрано создание для {mode_text}!\n\n"
+            f"Заголовок: \"{user_headers[user_id]}\"\n\n"
+            "Вот как будет выглядеть изображение для инвестпортала.\n"
+            "Выберите ориентацию - в полном размере я отрисую только её:",
+            reply_markup=create_landscape_orientation_keyboard()
+        )
+        return True
+    except Exception as e:
+        print(f"Ошибка отправки превью: {e}")
+        return False
+
+def choose_orientation_by_preview(message, user_id, file_id):
+    """Сохраняет фото пользователя и присылает превью вариантов вместо выбора вслепую"""
+    file_info = bot.get_file(file_id)
+    if not file_info.file_path:
+        bot.send_message(message.chat.id, "❌ Ошибка: не удалось получить путь к файлу.")
+        return
+    
+    # Дальше фото обрабатывается так же, как найденное: по кнопке ориентации
+    user_found_images[user_id] = {'data': bot.download_file(file_info.file_path), 'info': None}
+    user_state[user_id] = 'choosing_orientation_found'
+    if user_landscape_orientation.get(user_id) == 'both':
+        send_orientation_hint(message.chat.id, user_id, "соцсетей + инвестпортала")
+    else:
+        send_orientation_hint(message.chat.id, user_id, "только для инвестпортала")
+
 def send_orientation_hint(chat_id, user_id, mode_text):
-    """Отправляет изображение-подсказку с выбором ориентации"""
+    """Отправляет выбор ориентации: превью на фото пользователя или изображение-подсказку"""
+    if user_id in user_found_images:
+        # Фото уже есть - показываем все варианты на нем
+        if send_orientation_previews(chat_id, user_id, mode_text):
+            return
+    else:
+        # Фото еще нет - сначала просим его, чтобы выбрать ориентацию по превью
+        bot.send_message(
+            chat_id,
+            f"✅ Выбрано создание для {mode_text}!\n\n"
+            f"Заголовок: \"{user_headers[user_id]}\"\n\n"
+            "Теперь отправь мне фотографию или файл изображения.\n"
+            "Я покажу превью всех вариантов для инвестпортала, и ты выберешь лучший."
+        )
+        return
+    
     try:
         # Путь к изображению подсказки
         hint_path = os.path.join("hints", "Подсказка.png")
@@ -154,6 +268,7 @@ def send_orientation_hint(chat_id, user_id, mode_text):
                 f"✅ Выбрано создание для {mode_text}!\n\n"
                 f"Заголовок: \"{user_headers[user_id]}\"\n\n"
                 "Выберите ориентацию для инвестпортала:\n\n"
+                "✨ **Автоматически** - бот сам выберет кадр, чтобы главное не ушло под текст\n"
                 "💼 **По центру** - изображение располагается в центре\n"
                 "💼 **По верху** - изображение прижато к верхнему краю\n" 
                 "💼 **По низу** - изображение прижато к нижнему краю",
@@ -171,23 +286,6 @@ def send_orientation_hint(chat_id, user_id, mode_text):
             reply_markup=create_landscape_orientation_keyboard()
         )
 
-def create_temp_image_file(image_data, user_id):
-    """Создает временный файл изображения из данных"""
-    try:
-        # Создаем временную папку для пользователя
-        temp_dir = f"temp_found_{user_id}"
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # Сохраняем изображение
-        temp_path = os.path.join(temp_dir, f"found_image_{uuid.uuid4().hex}.jpg")
-        with open(temp_path, 'wb') as f:
-            f.write(image_data)
-        
-        return temp_path
-    except Exception as e:
-        print(f"Ошибка создания временного файла: {e}")
-        return None
-
 def process_found_image_automatically(user_id, chat_id):
     """Автоматическая обработка найденного изображения"""
     try:
@@ -254,17 +352,20 @@ def help_command(message):
         "   • Подтверди найденное изображение или найди другое\n"
         "4️⃣ Выбери режим обработки:\n"
         "   • 📱 Только для соцсетей - создаст квадратное изображение\n"
-        "   • 📱 Для соцсетей + 💼 Для инвестпортала - выбери ориентацию\n"
-        "   • 💼 Только для инвестпортала - выбери ориентацию\n"
+        "   • 📱 Для соцсетей + 💼 Для инвестпортала - выбери ориентацию по превью\n"
+        "   • 💼 Только для инвестпортала - выбери ориентацию по превью\n"
         "5️⃣ Если у тебя свое изображение - отправь фотографию или файл:\n"
         "   • Фото - будет сжато Telegram\n"
         "   • Файл - без сжатия, лучшее качество\n"
         "6️⃣ Получи результат:\n"
         "   • 📱 Для соцсетей (2160x2160) как файл\n"
         "   • 💼 Варианты для инвестпортала (2310x1200):\n"
+        "     - Автоматически (бот сам выбирает кадр)\n"
         "     - По центру\n"
         "     - По верху\n"
         "     - По низу\n\n"
+        "♻️ Чтобы поменять только заголовок, отправь новый текст и нажми\n"
+        "«То же фото с новым заголовком» - фото загружать заново не нужно.\n\n"
         "Команды:\n"
         "/start - Начать работу\n"
         "/help - Показать справку")
@@ -288,7 +389,7 @@ def get_text(message):
         bot.send_message(message.chat.id, 
             f"✅ Заголовок сохранен: \"{message.text}\"\n\n"
             "У вас уже есть изображение для новости?",
-            reply_markup=create_image_choice_keyboard())
+            reply_markup=create_image_choice_keyboard(user_id))
     
     elif current_state == 'waiting_search_query':
         # Сохраняем поисковый запрос и ищем изображения
@@ -313,7 +414,7 @@ def get_text(message):
             bot.send_message(message.chat.id, 
                 "❌ К сожалению, не удалось найти подходящие изображения.\n"
                 "Попробуйте другой поисковый запрос или загрузите свое изображение.",
-                reply_markup=create_image_choice_keyboard())
+                reply_markup=create_image_choice_keyboard(user_id))
             user_state[user_id] = 'choosing_image_source'
             return
         
@@ -337,7 +438,7 @@ def get_text(message):
             bot.send_message(message.chat.id, 
                 "❌ Не удалось скачать найденные изображения.\n"
                 "Попробуйте другой поисковый запрос или загрузите свое изображение.",
-                reply_markup=create_image_choice_keyboard())
+                reply_markup=create_image_choice_keyboard(user_id))
             user_state[user_id] = 'choosing_image_source'
             return
         
@@ -382,7 +483,7 @@ def get_text(message):
         bot.send_message(message.chat.id, 
             f"✅ Заголовок сохранен: \"{message.text}\"\n\n"
             "У вас уже есть изображение для новости?",
-            reply_markup=create_image_choice_keyboard())
+            reply_markup=create_image_choice_keyboard(user_id))
 
 def safe_edit_message(chat_id, message_id, new_text):
     """Безопасное редактирование сообщения с проверкой изменений"""
@@ -410,172 +511,91 @@ def process_image_file(message, file_info, user_id, found_image_data=None):
         else:
             downloaded_file = bot.download_file(file_info.file_path)
         
-        # Создаем временные папки
-        temp_img_dir = f"temp_img_{user_id}"
-        temp_logo_dir = f"temp_logo_{user_id}"
-        temp_output_dir = f"temp_output_{user_id}"
-        
-        os.makedirs(temp_img_dir, exist_ok=True)
-        os.makedirs(temp_logo_dir, exist_ok=True)
-        os.makedirs(temp_output_dir, exist_ok=True)
-        
-        # Определяем расширение файла
-        if found_image_data:
-            file_ext = '.jpg'  # Для найденных изображений используем jpg
-        else:
-            file_ext = os.path.splitext(file_info.file_path)[1].lower()
-            if not file_ext:
-                file_ext = '.jpg'  # По умолчанию
-        
-        # Сохраняем файл пользователя
-        input_path = os.path.join(temp_img_dir, f"user_image{file_ext}")
-        with open(input_path, 'wb') as f:
-            f.write(downloaded_file)
-        
-        # Копируем логотип из основной папки
-        logo_files = glob.glob(os.path.join(main.LOGO_DIR, '*'))
-        if not logo_files:
-            bot.send_message(message.chat.id, "❌ Ошибка: логотип не найден!")
-            return False
-        
-        logo_path = os.path.join(temp_logo_dir, "logo.png")
-        logo_img = Image.open(logo_files[0])
-        logo_img.save(logo_path)
-        
-        # Загружаем логотип
-        logo_img = main.safe_open_image(logo_path)
+        # Логотип берем из общего кэша (перечитывается, только если файл изменился)
+        logo_img = main.LOGO_ASSETS.logo()
         if logo_img is None:
-            bot.send_message(message.chat.id, "❌ Ошибка: не удалось загрузить логотип!")
+            bot.send_message(message.chat.id, "❌ Ошибка: логотип не найден или не загружается!")
             return False
         
-        # Определяем режим обработки
+        # Определяем режим обработки и нужные варианты
         orientation = user_landscape_orientation.get(user_id, 'bottom')
-        print(f"DEBUG: process_image_file: orientation={orientation}")
+        main.logger.debug(f"process_image_file: orientation={orientation}")
         
+        landscape_orientation = None
         if orientation == 'social_only':
             # Создаем только изображение для соцсетей
-            success = main.process_single_image_social_only(input_path, logo_img, user_headers[user_id])
+            variants = ['square']
         elif orientation.startswith('both_'):
             # Для соцсетей + инвестпортала с выбранной ориентацией
             landscape_orientation = orientation.split('_')[1]
-            landscape_config = {
-                'center': main.CONFIG_LANDSCAPE_CENTER,
-                'top': main.CONFIG_LANDSCAPE_TOP,
-                'bottom': main.CONFIG_LANDSCAPE_BOTTOM
-            }.get(landscape_orientation, main.CONFIG_LANDSCAPE_BOTTOM)
-            print(f"DEBUG: Режим 'both': выбрана ориентация '{landscape_orientation}', конфигурация: {landscape_config.get('image_alignment', 'unknown')}")
-            print(f"DEBUG: landscape_config = {landscape_config}")
-            success = main.process_single_image(input_path, logo_img, user_headers[user_id], landscape_config)
+            variants = ['square', f"landscape_{landscape_orientation}"]
         elif orientation.startswith('investor_only_'):
             # Только для инвестпортала с выбранной ориентацией
             landscape_orientation = orientation.split('_')[2]  # Берем третий элемент: investor_only_center -> center
-            print(f"DEBUG: investor_only: landscape_orientation = {landscape_orientation}")
-            print(f"DEBUG: investor_only: main.CONFIG_LANDSCAPE_CENTER = {main.CONFIG_LANDSCAPE_CENTER}")
-            landscape_config = {
-                'center': main.CONFIG_LANDSCAPE_CENTER,
-                'top': main.CONFIG_LANDSCAPE_TOP,
-                'bottom': main.CONFIG_LANDSCAPE_BOTTOM
-            }.get(landscape_orientation, main.CONFIG_LANDSCAPE_BOTTOM)
-            print(f"DEBUG: investor_only: выбранная конфигурация = {landscape_config}")
-            success = main.process_single_image_investor_only_single(input_path, logo_img, user_headers[user_id], landscape_config)
-
+            variants = [f"landscape_{landscape_orientation}"]
+        else:
+            variants = list(main.DEFAULT_VARIANTS)
         
-        if success:
+        if landscape_orientation and f"landscape_{landscape_orientation}" not in main.VARIANTS:
+            landscape_orientation = 'bottom'
+            variants[-1] = 'landscape_bottom'
+        main.logger.debug(f"process_image_file: variants={variants}")
+        
+        # Отдельная задача на запрос: результаты только в памяти задачи, без общих
+        # файлов в output/, поэтому запросы разных пользователей идут параллельно
+        with main.RenderJob(prefix=f"user{user_id}", save=False) as job:
+            results = job.render(downloaded_file, user_headers[user_id], variants, logo_img=logo_img,
+                                 base_name='user_image', profile=OUTPUT_PROFILE)
+        cached = [name for name, result in results.items() if result['cached']]
+        main.logger.info(f"Задача {job.job_id}: из кэша {cached}, статистика кэша {main.RESULT_CACHE.stats()}")
+        
+        if results:
+            # Фото и режим запоминаем: новый заголовок можно наложить без повторной загрузки
+            remember_last_render(user_id, downloaded_file, orientation)
+            
             # Отправляем результаты
             bot.send_message(message.chat.id, "✅ Обработка завершена! Отправляю результаты...")
             
-            # Показываем все файлы в папке output для отладки
-            all_files = os.listdir(main.OUTPUT_DIR)
-            print(f"DEBUG: Все файлы в папке output после обработки: {all_files}")
-            
-            # Получаем базовое имя файла без расширения
-            base_name = os.path.splitext(os.path.basename(input_path))[0]
-            print(f"DEBUG: base_name = {base_name}")
-            print(f"DEBUG: input_path = {input_path}")
-            
             # Определяем названия ориентаций (используется во всех режимах)
             orientation_names = {
+                'auto': 'автоматически',
                 'center': 'по центру',
                 'top': 'по верху', 
                 'bottom': 'по низу'
             }
+            orientation_name = orientation_names.get(landscape_orientation, 'по низу')
             
-            # Отправляем результаты в зависимости от выбранного режима
-            if orientation == 'social_only':
-                # Отправляем только изображение для соцсетей
-                square_path = os.path.join(main.OUTPUT_DIR, f"{base_name}_square.png")
-                if os.path.exists(square_path):
-                    with open(square_path, 'rb') as f:
-                        bot.send_document(message.chat.id, f, 
-                                       caption="📱 Для соцсетей (2160x2160)")
-                else:
-                    bot.send_message(message.chat.id, "⚠️ Изображение для соцсетей не найдено")
-                
-                bot.send_message(message.chat.id, 
-                    "🎉 Готово! Обработано изображение с заголовком:\n"
-                    f"\"{user_headers[user_id]}\"\n\n"
-                    f"📱 Для соцсетей (2160x2160)\n\n"
-                    "Отправь новый заголовок для следующего изображения.")
-            
-            elif orientation.startswith('both_'):
+            if 'square' in variants:
                 # Отправляем изображение для соцсетей
-                square_path = os.path.join(main.OUTPUT_DIR, f"{base_name}_square.png")
-                if os.path.exists(square_path):
-                    with open(square_path, 'rb') as f:
-                        bot.send_document(message.chat.id, f, 
-                                       caption="📱 Для соцсетей (2160x2160)")
+                if 'square' in results:
+                    bot.send_document(message.chat.id, results['square']['data'],
+                                      visible_file_name=results['square']['filename'],
+                                      caption="📱 Для соцсетей (2160x2160)")
                 else:
                     bot.send_message(message.chat.id, "⚠️ Изображение для соцсетей не найдено")
-                
+            
+            if landscape_orientation:
                 # Отправляем изображение для инвестпортала с выбранной ориентацией
-                landscape_orientation = orientation.split('_')[1]
-                landscape_path = os.path.join(main.OUTPUT_DIR, f"{base_name}_landscape_{landscape_orientation}.png")
-                print(f"DEBUG: Ищем файл: {landscape_path}")
-                print(f"DEBUG: Файл существует: {os.path.exists(landscape_path)}")
-                if os.path.exists(landscape_path):
-                    with open(landscape_path, 'rb') as f:
-                        orientation_name = orientation_names.get(landscape_orientation, 'по низу')
-                        bot.send_document(message.chat.id, f, 
-                                       caption=f"💼 Для инвестпортала (2310x1200) - {orientation_name}")
+                landscape = results.get(f"landscape_{landscape_orientation}")
+                if landscape:
+                    bot.send_document(message.chat.id, landscape['data'],
+                                      visible_file_name=landscape['filename'],
+                                      caption=f"💼 Для инвестпортала (2310x1200) - {orientation_name}")
                 else:
                     bot.send_message(message.chat.id, "⚠️ Изображение для инвестпортала не найдено")
-                    # Показываем все файлы в папке для отладки
-                    all_files = os.listdir(main.OUTPUT_DIR)
-                    print(f"DEBUG: Все файлы в папке output: {all_files}")
-                    print(f"DEBUG: Ищем файл с базовым именем: {base_name}")
-                
-                # Определяем название ориентации для сообщения
-                orientation_name = orientation_names.get(landscape_orientation, 'по низу')
-                
-                bot.send_message(message.chat.id, 
-                    "🎉 Готово! Обработано изображение с заголовком:\n"
-                    f"\"{user_headers[user_id]}\"\n\n"
-                    f"📱 Для соцсетей (2160x2160)\n"
-                    f"💼 Для инвестпортала (2310x1200) - {orientation_name}\n\n"
-                    "Отправь новый заголовок для следующего изображения.")
             
-            elif orientation.startswith('investor_only_'):
-                # Отправляем только изображение для инвестпортала с выбранной ориентацией
-                landscape_orientation = orientation.split('_')[2]  # Берем третий элемент: investor_only_center -> center
-                landscape_path = os.path.join(main.OUTPUT_DIR, f"{base_name}_landscape_{landscape_orientation}.png")
-                if os.path.exists(landscape_path):
-                    with open(landscape_path, 'rb') as f:
-                        orientation_name = orientation_names.get(landscape_orientation, 'по низу')
-                        bot.send_document(message.chat.id, f, 
-                                       caption=f"💼 Для инвестпортала (2310x1200) - {orientation_name}")
-                else:
-                    bot.send_message(message.chat.id, "⚠️ Изображение для инвестпортала не найдено")
-                
-                # Определяем название ориентации для сообщения
-                orientation_name = orientation_names.get(landscape_orientation, 'по низу')
-                
-                bot.send_message(message.chat.id, 
-                    "🎉 Готово! Обработано изображение с заголовком:\n"
-                    f"\"{user_headers[user_id]}\"\n\n"
-                    f"💼 Для инвестпортала (2310x1200) - {orientation_name}\n\n"
-                    "Отправь новый заголовок для следующего изображения.")
+            # Итоговое сообщение в зависимости от выбранного режима
+            summary = []
+            if 'square' in variants:
+                summary.append("📱 Для соцсетей (2160x2160)")
+            if landscape_orientation:
+                summary.append(f"💼 Для инвестпортала (2310x1200) - {orientation_name}")
             
-
+            bot.send_message(message.chat.id, 
+                "🎉 Готово! Обработано изображение с заголовком:\n"
+                f"\"{user_headers[user_id]}\"\n\n"
+                + "\n".join(summary) + "\n\n"
+                "Отправь новый заголовок для следующего изображения.")
             
             return True
         else:
@@ -587,26 +607,6 @@ def process_image_file(message, file_info, user_id, found_image_data=None):
         bot.send_message(message.chat.id, 
             "Произошла ошибка. Попробуй еще раз или обратись к администратору.")
         return False
-    
-    finally:
-        # Очищаем временные файлы
-        try:
-            if 'temp_img_dir' in locals():
-                for file in os.listdir(temp_img_dir):
-                    os.remove(os.path.join(temp_img_dir, file))
-                os.rmdir(temp_img_dir)
-            
-            if 'temp_logo_dir' in locals():
-                for file in os.listdir(temp_logo_dir):
-                    os.remove(os.path.join(temp_logo_dir, file))
-                os.rmdir(temp_logo_dir)
-            
-            if 'temp_output_dir' in locals():
-                for file in os.listdir(temp_output_dir):
-                    os.remove(os.path.join(temp_output_dir, file))
-                os.rmdir(temp_output_dir)
-        except:
-            pass
         
 def create_orientation_keyboard():
     """Создает клавиатуру с выбором режима обработки"""
@@ -625,6 +625,9 @@ def create_orientation_keyboard():
 def create_landscape_orientation_keyboard():
     """Создает клавиатуру с выбором ориентации для инвестпортала"""
     keyboard = InlineKeyboardMarkup()
+    keyboard.row(
+        InlineKeyboardButton("✨ Автоматически", callback_data="orientation_auto")
+    )
     keyboard.row(
         InlineKeyboardButton("💼 По центру", callback_data="orientation_center"),
         InlineKeyboardButton("💼 По верху", callback_data="orientation_top")
@@ -672,6 +675,23 @@ def handle_image_source_choice(call):
             message_id=call.message.message_id
         )
 
+@bot.callback_query_handler(func=lambda call: call.data == 'reuse_image')
+def handle_reuse_image(call):
+    """Повторная обработка последнего фото с новым заголовком (перерисовывается только текст)"""
+    user_id = call.from_user.id
+    last = get_last_render(user_id)
+    
+    if user_id not in user_headers or last is None:
+        bot.answer_callback_query(call.id, "Прошлое фото уже недоступно, загрузите его заново")
+        return
+    
+    bot.answer_callback_query(call.id, "Обрабатываю прошлое фото")
+    user_landscape_orientation[user_id] = last['orientation']
+    user_state[user_id] = 'waiting_header'
+    safe_edit_message(call.message.chat.id, call.message.message_id,
+        f"♻️ Использую прошлое фото с новым заголовком:\n\"{user_headers[user_id]}\"")
+    process_image_file(call.message, None, user_id, last['data'])
+
 @bot.callback_query_handler(func=lambda call: call.data in ['approve_image', 'search_another'])
 def handle_image_approval(call):
     """Обработка подтверждения найденного изображения"""
@@ -819,6 +839,7 @@ def handle_landscape_orientation_choice(call):
     
     # Определяем названия ориентаций (используется во всех режимах)
     orientation_names = {
+        'auto': 'автоматически',
         'center': 'по центру',
         'top': 'по верху', 
         'bottom': 'по низу'
@@ -926,6 +947,14 @@ def get_photo(message):
         bot.send_message(message.chat.id, "Сначала выберите, откуда взять изображение!")
         return
     
+    # Ориентация еще не выбрана - сначала показываем превью на этом фото
+    if current_state == 'choosing_orientation' and user_landscape_orientation.get(user_id) in ['both', 'investor_only']:
+        try:
+            choose_orientation_by_preview(message, user_id, message.photo[-1].file_id)
+        except Exception as e:
+            bot.send_message(message.chat.id, f"❌ Ошибка обработки: {str(e)}")
+        return
+    
     # Отправляем сообщение о начале обработки
     processing_msg = bot.send_message(message.chat.id, "🔄 Обрабатываю изображение...")
     
@@ -993,6 +1022,14 @@ def get_document(message):
             f"Поддерживаемые форматы: {', '.join(allowed_extensions)}")
         return
     
+    # Ориентация еще не выбрана - сначала показываем превью на этом файле
+    if current_state == 'choosing_orientation' and user_landscape_orientation.get(user_id) in ['both', 'investor_only']:
+        try:
+            choose_orientation_by_preview(message, user_id, message.document.file_id)
+        except Exception as e:
+            bot.send_message(message.chat.id, f"❌ Ошибка обработки: {str(e)}")
+        return
+    
     # Отправляем сообщение о начале обработки
     processing_msg = bot.send_message(message.chat.id, "🔄 Обрабатываю файл изображения...")
     
@@ -1052,6 +1089,16 @@ def echo_all(message):
             "Отправь мне заголовок (текст), который нужно добавить на фото.")
 
 if __name__ == "__main__":
+    # Шрифты, логотип и рамки загружаем один раз при запуске, а не на каждый запрос
+    main.FONT_REGISTRY.preload()
+    logo_img = main.LOGO_ASSETS.preload()
+    if logo_img is not None:
+        main.preload_brand_frames(logo_img)
+    # Папки задач, оставшиеся после прошлого запуска
+    main.cleanup_jobs()
+    if STATS_LOG_INTERVAL:
+        threading.Thread(target=log_stats_periodically, args=(STATS_LOG_INTERVAL,), daemon=True).start()
+    
     print("🤖 Telegram бот запущен...")
     print("📱 Откройте Telegram и найдите вашего бота")
     print("⌨️  Используйте команду /start для начала работы")
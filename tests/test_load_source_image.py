@@ -0,0 +1,73 @@
+"""Загрузка исходного фото: предварительное уменьшение для всех режимов PIL"""
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+def _png(mode: str, size=(6000, 4000)) -> bytes:
+    """Большой PNG в заданном режиме (P - палитра из 256 цветов)"""
+    gray = Image.fromarray(np.add.outer(np.arange(size[1]), np.arange(size[0])).astype(np.uint8), 'L')
+    image = gray.convert('RGB').quantize(256) if mode == 'P' else gray.convert(mode)
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+@pytest.mark.parametrize('mode', ['P', '1', 'I;16', 'L', 'LA'])
+def test_reduce_for_modes_without_reduce_support(mode):
+    # Уменьшенный ландшафт: коэффициент reduce() заведомо >= 2
+    config = main.scale_config(main.CONFIG_LANDSCAPE_BOTTOM, 0.25)
+    source = main.load_source_image(_png(mode), [config])
+    assert source is not None
+    assert source.image.mode == ('RGBA' if mode == 'LA' else 'RGB')
+    target_width, target_height = main.get_render_plan(config).size
+    assert source.image.width < 6000
+    assert source.image.width >= target_width * main.REDUCING_GAP
+    assert source.image.height >= target_height * main.REDUCING_GAP
+
+def test_large_palette_landscape():
+    source = main.load_source_image(_png('P'), [main.CONFIG_LANDSCAPE_BOTTOM])
+    assert source is not None
+    assert source.image.mode == 'RGB'
+    frame = source.fit(*main.get_render_plan(main.CONFIG_LANDSCAPE_BOTTOM).size)
+    assert frame.mode == 'RGB'
+
+def test_plain_rgb_jpeg_is_loaded():
+    # JPEG под размер цели: без draft, reduce и convert, но пиксели уже декодированы
+    width, height = main.get_render_plan(main.CONFIG_LANDSCAPE_BOTTOM).size
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 80, 40)).save(buffer, 'JPEG')
+    source = main.load_source_image(buffer.getvalue(), [main.CONFIG_LANDSCAPE_BOTTOM])
+    assert source is not None
+    assert source.image.mode == 'RGB'
+    assert source.image.im is not None
+    assert getattr(source.image, 'fp', None) is None
+
+def test_decode_stage_includes_pixel_decoding(monkeypatch):
+    # Без кэшей рендер каждый раз декодирует фото заново
+    monkeypatch.setattr(main, 'RESULT_CACHE', main.ResultCache(max_bytes=0))
+    monkeypatch.setattr(main, 'BACKGROUND_CACHE', main.BackgroundCache(max_entries=0))
+    rng = np.random.default_rng(0)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (2000, 3000, 3), dtype=np.uint8)).save(buffer, 'JPEG', quality=95)
+    logo = Image.new('RGBA', (200, 100), (255, 255, 255, 255))
+    timings = main.StageTimings()
+    results = main.render(buffer.getvalue(), 'Заголовок', ['landscape_bottom'], logo_img=logo, timings=timings)
+    assert 'landscape_bottom' in results
+    # Разбор одного заголовка JPEG занимает доли миллисекунды, декодирование - десятки
+    assert timings.stages['decode'] > 0.005
+
+def test_peak_memory_omitted_when_reset_fails(monkeypatch):
+    # Без сброса VmHWM пик был бы пиком всего процесса, а не задачи
+    monkeypatch.setattr(main, '_reset_peak_memory', lambda: False)
+    job = main._timed_job(lambda timings=None: True)
+    timings = main.StageTimings()
+    assert job(timings=timings)
+    assert timings.peak_memory_mb is None
+    assert 'peak_memory_mb' not in timings.as_dict()
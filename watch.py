@@ -0,0 +1,315 @@
+"""Наблюдение за папкой img/: рендеринг новых и измененных фото
+
+Заголовок берется из файла-спутника с тем же именем и расширением .txt
+(photo.jpg -> photo.txt) или из --text для фото без спутника. Файл
+считается дописанным, когда его размер и время изменения не меняются
+SETTLE_SECONDS. Индекс состояния (размер, mtime и хеш фото, заголовок ->
+файлы результата) хранится в JSON, поэтому после перезапуска уже
+отрисованные фото не обрабатываются заново. Рендеринг идет на пуле
+процессов, мелкие файлы отправляются первыми.
+
+    python watch.py                     # следить за img/ постоянно
+    python watch.py --once              # обработать изменения и выйти
+    python watch.py --text "Заголовок" --variants square landscape --alignment auto
+"""
+import os
+import sys
+import json
+import time
+import glob
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+import main
+import batch
+from main import ImageProcessorError, logger
+
+# Период опроса папки, сек
+POLL_INTERVAL = 2.0
+
+# Сколько секунд файл не должен меняться, чтобы считаться дописанным
+SETTLE_SECONDS = 2.0
+
+# Файл состояния (рядом с результатами)
+STATE_FILE = '.watch_state.json'
+
+# Расширения фото, за которыми следим
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+
+# Расширение файла-спутника с заголовком
+SIDECAR_EXTENSION = '.txt'
+
+def _signature(path: Optional[str]) -> Optional[List[int]]:
+    """[mtime_ns, размер] файла или None, если файла нет"""
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+def _file_digest(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class WatchState:
+    """Индекс обработанных фото: {имя файла: запись}, сохраняется атомарно"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать состояние {path}, начинаем с нуля: {e}")
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+class FolderWatcher:
+    """Опрос папки, ожидание дописывания файлов и отправка изменений на пул"""
+
+    def __init__(self, img_dir: str, output_dir: str, state_path: str, logo_path: str,
+                 workers: int, settle: float = SETTLE_SECONDS, default_text: Optional[str] = None,
+                 variants: Optional[List[str]] = None, alignment: Optional[str] = None,
+                 profile: Optional[str] = None):
+        self.img_dir = img_dir
+        self.output_dir = output_dir
+        self.settle = settle
+        self.default_text = default_text
+        self.options = {'variants': variants, 'alignment': alignment, 'format': profile}
+        self.state = WatchState(state_path)
+        self.logo_path = logo_path
+        self.workers = workers
+        self.executor = self._new_executor()
+        self._unstable = {}   # имя -> (подписи фото и спутника, время последнего изменения)
+        self._in_flight = {}  # имя -> (future, запись состояния на момент отправки)
+        self._skipped = set()  # фото без заголовка (сообщаем один раз)
+        self._ambiguous = set()  # группы фото с одинаковым именем без расширения
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=batch.init_worker,
+                                   initargs=(self.logo_path,))
+    
+    def _restart_executor(self) -> None:
+        """Новый пул вместо сломанного (процесс упал или был убит)
+        
+        Незавершенные фото забываются без записи в состояние: при следующем
+        опросе они снова попадут в очередь.
+        """
+        for future, _ in self._in_flight.values():
+            future.cancel()
+        self._in_flight.clear()
+        self.executor.shutdown(wait=False)
+        self.executor = self._new_executor()
+    
+    def _scan(self) -> Dict[str, Tuple[str, Optional[str]]]:
+        """{имя фото: (путь, путь к спутнику или None)}"""
+        by_stem = {}
+        for path in glob.glob(os.path.join(self.img_dir, '*')):
+            name = os.path.basename(path)
+            stem, extension = os.path.splitext(name)
+            if name.startswith('.') or extension.lower() not in IMAGE_EXTENSIONS:
+                continue
+            by_stem.setdefault(stem, []).append(path)
+
+        found = {}
+        ambiguous = set()
+        for stem, paths in by_stem.items():
+            # photo.jpg и photo.png делили бы файлы результата и photo.txt - пропускаем оба
+            if len(paths) > 1:
+                names = tuple(sorted(os.path.basename(path) for path in paths))
+                ambiguous.add(names)
+                if names not in self._ambiguous:
+                    logger.warning(f"Пропущены фото с одинаковым именем: {', '.join(names)} - переименуйте их")
+                continue
+            sidecar = os.path.join(self.img_dir, stem + SIDECAR_EXTENSION)
+            found[os.path.basename(paths[0])] = (paths[0], sidecar if os.path.exists(sidecar) else None)
+        self._ambiguous = ambiguous
+        return found
+
+    def _read_text(self, sidecar: Optional[str]) -> Optional[str]:
+        if sidecar is None:
+            return self.default_text
+        with open(sidecar, encoding='utf-8-sig') as f:
+            return f.read().strip() or self.default_text
+
+    def poll(self) -> int:
+        """Один проход по папке; возвращает число отправленных на рендеринг фото"""
+        now = time.time()
+        found = self._scan()
+        ready = []
+        for name, (path, sidecar) in found.items():
+            if name in self._in_flight:
+                continue
+            signatures = [_signature(path), _signature(sidecar)]
+            if signatures[0] is None:
+                continue
+            entry = self.state.entries.get(name)
+            if entry and [entry['signature'], entry['text_signature']] == signatures:
+                self._unstable.pop(name, None)
+                continue
+
+            # Ждем, пока фото и спутник перестанут меняться
+            previous = self._unstable.get(name)
+            if previous is None or previous[0] != signatures:
+                self._unstable[name] = (signatures, now)
+                continue
+            if now - previous[1] < self.settle:
+                continue
+            del self._unstable[name]
+            ready.append((signatures[0][1], name, path, sidecar, signatures))
+
+        # Фото пропали из папки - забываем их (результаты остаются)
+        for name in set(self.state.entries) - set(found):
+            del self.state.entries[name]
+        for name in set(self._unstable) - set(found):
+            del self._unstable[name]
+
+        # Мелкие файлы первыми, чтобы крупная выгрузка их не задерживала
+        submitted = 0
+        state_changed = False
+        for _, name, path, sidecar, signatures in sorted(ready):
+            try:
+                text = self._read_text(sidecar)
+                if not text:
+                    if name not in self._skipped:
+                        logger.info(f"Нет заголовка для {name}: ожидаем {os.path.splitext(name)[0]}{SIDECAR_EXTENSION}")
+                        self._skipped.add(name)
+                    continue
+                digest = _file_digest(path)
+            except OSError as e:
+                logger.warning(f"Не удалось прочитать {name}: {e}")
+                continue
+            self._skipped.discard(name)
+
+            entry = self.state.entries.get(name)
+            record = {'signature': signatures[0], 'text_signature': signatures[1], 'digest': digest, 'text': text}
+            if entry and entry.get('status') == 'ok' and entry['digest'] == digest and entry['text'] == text:
+                # Изменилось только время файла (копирование, touch) - перерисовывать нечего
+                entry.update(record)
+                state_changed = True
+                continue
+
+            item = dict(self.options, id=name, row=0, image=path, text=text,
+                        base_name=os.path.splitext(name)[0])
+            self._in_flight[name] = (self.executor.submit(batch.process_item, item, self.output_dir), record)
+            logger.info(f"В очереди: {name}")
+            submitted += 1
+        if state_changed:
+            self.state.save()
+        return submitted
+
+    def collect(self) -> int:
+        """Забирает завершенные рендеры и обновляет состояние; возвращает их число"""
+        finished = [name for name, (future, _) in self._in_flight.items() if future.done()]
+        for name in finished:
+            future, record = self._in_flight.pop(name)
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                result = {'status': 'error', 'error': str(e), 'outputs': {}, 'seconds': 0.0}
+            # Ошибочные фото тоже запоминаем: повторная попытка - после изменения файла
+            record.update({
+                'status': result['status'],
+                'error': result.get('error'),
+                'outputs': result.get('outputs', {}),
+                'rendered_at': time.time(),
+            })
+            self.state.entries[name] = record
+            status = '✅' if result['status'] == 'ok' else f"❌ {result.get('error')}"
+            logger.info(f"{name}: {status} ({result['seconds']:.2f} сек)")
+        if finished:
+            self.state.save()
+        return len(finished)
+
+    @property
+    def busy(self) -> bool:
+        return bool(self._in_flight or self._unstable)
+
+    def run(self, interval: float = POLL_INTERVAL, once: bool = False) -> None:
+        """Цикл опроса; при once - до обработки всех текущих изменений"""
+        logger.info(f"Наблюдение за папкой {self.img_dir} (опрос каждые {interval} сек)")
+        try:
+            while True:
+                try:
+                    self.poll()
+                    self.collect()
+                except BrokenProcessPool as e:
+                    logger.error(f"Пул процессов рендеринга сломан, перезапускаем: {e}")
+                    self._restart_executor()
+                    # Сброшенные фото попадут в очередь на следующем опросе
+                    time.sleep(interval)
+                    continue
+                if once and not self.busy:
+                    break
+                time.sleep(interval)
+        finally:
+            for future, _ in self._in_flight.values():
+                future.cancel()
+            self.executor.shutdown(wait=True)
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Наблюдение за папкой с фото и рендеринг изменений')
+    parser.add_argument('--img-dir', default=main.IMG_DIR, help='Папка с фото и файлами заголовков')
+    parser.add_argument('--output-dir', default=main.OUTPUT_DIR, help='Папка для готовых изображений')
+    parser.add_argument('--state', default=None, help=f"Файл состояния (по умолчанию <output-dir>/{STATE_FILE})")
+    parser.add_argument('--logo', default=None, help=f"Логотип (по умолчанию первый файл из {main.LOGO_DIR}/)")
+    parser.add_argument('--text', default=None, help='Заголовок для фото без файла .txt')
+    parser.add_argument('--variants', nargs='*', default=None,
+                        help='Варианты (square, landscape, landscape_center, ...); по умолчанию square landscape')
+    parser.add_argument('--alignment', default=None, choices=list(main.IMAGE_ALIGNMENTS),
+                        help='Выравнивание для варианта landscape')
+    parser.add_argument('--format', default=None, choices=list(main.ENCODER_PROFILES), help='Профиль кодирования')
+    parser.add_argument('--workers', type=int, default=main.BATCH_WORKERS or os.cpu_count() or 1,
+                        help='Число процессов')
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL, help='Период опроса, сек')
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                        help='Сколько секунд файл не должен меняться перед обработкой')
+    parser.add_argument('--once', action='store_true', help='Обработать текущие изменения и выйти')
+    return parser.parse_args(argv)
+
+def main_watch(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    try:
+        if not os.path.isdir(args.img_dir):
+            raise ImageProcessorError(f"Папка {args.img_dir} не найдена!")
+        logo_path = args.logo or next(iter(sorted(glob.glob(os.path.join(main.LOGO_DIR, '*')))), None)
+        if logo_path is None:
+            raise ImageProcessorError('Логотип не найден в папке logo!')
+        default_text = None
+        if args.text is not None:
+            try:
+                default_text = main.validate_text(args.text)
+            except ValueError as e:
+                raise ImageProcessorError(f"--text: {e}")
+        os.makedirs(args.output_dir, exist_ok=True)
+        watcher = FolderWatcher(
+            args.img_dir, args.output_dir, args.state or os.path.join(args.output_dir, STATE_FILE),
+            logo_path, max(args.workers, 1), args.settle, default_text,
+            args.variants, args.alignment, args.format,
+        )
+        watcher.run(args.interval, once=args.once)
+    except ImageProcessorError as e:
+        logger.error(f"Ошибка наблюдения: {e}")
+        print(f"❌ Ошибка: {e}")
+        return 2
+    except KeyboardInterrupt:
+        print("\n⏹️  Наблюдение остановлено")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main_watch())